@@ -0,0 +1,240 @@
+import io
+import sys
+import json
+import typing
+import hashlib
+import pathlib
+import argparse
+import contextlib
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import cli
+import periods
+import payroll
+import tracing
+import timezone
+
+
+# ========================================================================
+# =================       Synthetic Timesheets          =====================
+# ========================================================================
+#
+# Entries / Pay Rate workbooks with the real schema.  Every employee works
+# back to back shifts of 4-14 hours with 8-30 hour gaps starting at random
+# times of day, so most weeks cross 40 hours and many shifts run overnight.
+# The pay period straddles a DST switch (fall back by default) so some
+# shifts cross it; endpoints that land on an ambiguous or nonexistent local
+# time are moved two hours later, the same way a real timesheet never has them.
+
+SIZES = [100, 1_000, 10_000, 100_000]
+SCHEDULES = ["Paddington", "Betty Drive", "Westland", "South Jordan"]
+SCHEDULE_WEIGHTS = [0.3, 0.3, 0.2, 0.2]
+LAST_NAMES = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "RODRIGUEZ", "MARTINEZ", "HERNANDEZ", "LOPEZ", "WILSON", "ANDERSON", "THOMAS", "TAYLOR"]
+SHIFTS_PER_EMPLOYEE = 14
+STARTUP_COMMANDS = [["--help"], ["--list"], ["--verify-pay-rates"]]
+
+
+def localizable(times: pd.Series) -> np.ndarray:
+    localized = pd.DatetimeIndex(times).tz_localize(timezone.DEFAULT, ambiguous='NaT', nonexistent='NaT')
+    return ~localized.isna()
+
+
+def synthetic_timesheet(shifts: int, seed: int = 0, period_start: str = "2023-10-29") -> typing.Tuple[pd.DataFrame, pd.DataFrame]:
+    """ (entries, pay_rates) frames with `shifts` rows of Entries """
+    rng = np.random.default_rng(seed)
+    employees = max(1, -(-shifts // SHIFTS_PER_EMPLOYEE))
+    employee = np.arange(shifts) % employees
+
+    durations = rng.integers(4 * 60, 14 * 60, shifts) * 60 + rng.integers(0, 60, shifts)   # seconds
+    gaps      = rng.integers(8 * 60, 30 * 60, shifts) * 60 + rng.integers(0, 60, shifts)
+    first     = rng.integers(0, 24 * 60, employees) * 60
+
+    # Back to back shifts per employee: start = first shift + sum of earlier (duration + gap)
+    order = np.argsort(employee, kind="stable")
+    step = (durations + gaps)[order]
+    cumulative = np.cumsum(step) - step
+    group_start = np.searchsorted(employee[order], np.arange(employees))
+    offsets = np.empty(shifts, dtype=np.int64)
+    offsets[order] = cumulative - np.repeat(cumulative[group_start], np.diff(np.append(group_start, shifts))) + np.repeat(first, np.diff(np.append(group_start, shifts)))
+
+    start = pd.Timestamp(period_start) + pd.to_timedelta(offsets, unit="s")
+    end = start + pd.to_timedelta(durations, unit="s")
+    for _ in range(2):
+        bad = ~(localizable(start.floor("min")) & localizable(end))
+        start = start.where(~bad, start + pd.Timedelta(hours=2))
+        end = end.where(~bad, end + pd.Timedelta(hours=2))
+
+    first_names = np.array([f"EMP{i:06d}" for i in range(employees)])
+    last_names = np.array(LAST_NAMES)[np.arange(employees) % len(LAST_NAMES)]
+    regular = np.round((end - start).total_seconds().to_numpy() / 3600, 2)
+
+    entries = pd.DataFrame({
+        "First Name": first_names[employee],
+        "Last Name": last_names[employee],
+        "Employee ID": employee,
+        "Date": start,
+        "Start Time": start,
+        "End Time": end,
+        "Unpaid Breaks": 0,
+        "Regular": regular,
+        "OT": np.nan,
+        "Schedule": rng.choice(SCHEDULES, shifts, p=SCHEDULE_WEIGHTS),
+    }).sort_values(["First Name", "Start Time"], ignore_index=True)
+
+    pay_rates = pd.DataFrame({
+        "LAST": last_names,
+        "FIRST": first_names,
+        "Day Rate": rng.integers(32, 50, employees) / 2,
+        "Night Rate": rng.integers(16, 21, employees),
+    })
+    return entries, pay_rates
+
+
+def write_synthetic(directory: pathlib.Path, shifts: int, seed: int = 0, period_start: str = "2023-10-29") -> typing.Tuple[pathlib.Path, pathlib.Path]:
+    """ Write (or reuse) the timesheet and pay rate workbooks for one size """
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"synthetic-{shifts}-{seed}-{period_start}"
+    timesheet, pay_rate_file = directory / f"{stem}.xlsx", directory / f"{stem} - Pay Rate.xlsx"
+    if timesheet.exists() and pay_rate_file.exists():
+        return timesheet, pay_rate_file
+
+    entries, pay_rates = synthetic_timesheet(shifts, seed, period_start)
+    with pd.ExcelWriter(timesheet, engine="xlsxwriter") as writer:
+        entries.to_excel(writer, sheet_name="Entries", index=False)
+    with pd.ExcelWriter(pay_rate_file, engine="xlsxwriter") as writer:
+        pay_rates.to_excel(writer, sheet_name="Pay Rate", index=False)
+    return timesheet, pay_rate_file
+
+
+# ========================================================================
+# =================            Benchmark Run            =====================
+# ========================================================================
+
+def digest(*frames: pd.DataFrame) -> str:
+    """ Hash of the output frames rounded to the cent """
+    h = hashlib.sha256()
+    for frame in frames:
+        h.update(frame.round(2).to_csv().encode())
+    return h.hexdigest()[:16]
+
+
+def run_pipeline(timesheet: pathlib.Path, pay_rate_file: pathlib.Path, engine: str = "interval", workers: int = 1) -> dict:
+    """ One uncached read -> calculate -> write run, returns stage seconds and the output digest """
+    args = payroll.parse_args(["--engine", engine, "--workers", str(workers), "--no-cache"])
+    tracing.configure(profile=True)
+
+    st = datetime.now()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sheet = payroll.read_timesheet(timesheet)
+        pay_rates = payroll.read_pay_rates(pay_rate_file)
+        g, d, hours_output, pay_output = payroll.calc_payroll(sheet, pay_rates, args)
+        payroll.write_payroll(io.BytesIO(), hours_output, pay_output)
+    total = (datetime.now() - st).total_seconds()
+
+    stages = {stage["name"]: round(stage["total"], 4) for stage in tracing.summary()}
+    tracing.configure()
+    return {"rows": len(sheet), "employees": len(d), "total": round(total, 4), "stages": stages, "digest": digest(hours_output, pay_output)}
+
+
+# ========================================================================
+# =================         Startup Import Budget        =================
+# ========================================================================
+#
+# The light command line paths (cli.py) must not import pandas & co. and
+# must stay inside --startup-budget milliseconds of imports, measured with
+# `python -X importtime` in a fresh interpreter.
+
+def startup_imports(argv: typing.List[str]) -> typing.Tuple[float, typing.Set[str]]:
+    """ Seconds spent importing and the modules imported by `python payroll.py argv` """
+    result = subprocess.run([sys.executable, "-X", "importtime", str(payroll.cd / "payroll.py"), *argv], input="\n", capture_output=True, text=True, cwd=payroll.cd)
+    total, modules = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):   # top level import, its cumulative time includes everything below it
+            total += int(cumulative)
+    return total / 1e6, modules
+
+
+def check_startup(budget_ms: float) -> typing.List[str]:
+    problems = []
+    if (cli.WEEKDAYS, cli.DEFAULT_ANCHOR, cli.DST_POLICIES) != (periods.WEEKDAYS, periods.DEFAULT_ANCHOR, timezone.POLICIES):
+        problems.append("cli.py option choices are out of step with periods.py / timezone.py")
+
+    for argv in STARTUP_COMMANDS:
+        seconds, modules = startup_imports(argv)
+        heavy = [module for module in cli.HEAVY_MODULES if module in modules]
+        print(f"{'startup':>8} {' '.join(argv):<20} {seconds * 1000:>7.1f}ms imports" + (f"  imports {', '.join(heavy)}" if heavy else ""))
+        if heavy:
+            problems.append(f"payroll.py {' '.join(argv)} imports {', '.join(heavy)}")
+        if seconds * 1000 > budget_ms:
+            problems.append(f"payroll.py {' '.join(argv)} spent {seconds * 1000:.1f}ms importing, budget {budget_ms:g}ms")
+    print()
+    return problems
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time every payroll stage on synthetic timesheets and check the outputs agree")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--period-start", type=str, default="2023-10-29", help="First day of the synthetic pay period (default straddles the Nov 5 2023 fall back)")
+    parser.add_argument("--engines", type=str, nargs="+", default=["interval", "minute"], choices=["interval", "minute"])
+    parser.add_argument("--minute-max", type=int, default=1_000, help="Largest size to run through the (slow) minute engine")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--data-dir", type=str, default="bench_data")
+    parser.add_argument("--save", type=str, metavar="FILE", help="Write results as the baseline for later --compare runs")
+    parser.add_argument("--compare", type=str, metavar="FILE", help="Fail on digest changes or slowdowns against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed total time ratio against the baseline")
+    parser.add_argument("--min-slowdown", type=float, default=0.25, help="Ignore slowdowns smaller than this many seconds (timer noise on small sizes)")
+    parser.add_argument("--startup-budget", type=float, default=100, help="Allowed import milliseconds of the light command line paths")
+    parser.add_argument("--startup-only", action="store_true", help="Only run the startup import check")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    baseline = json.loads(pathlib.Path(args.compare).read_text()) if args.compare else {}
+
+    results, problems = {}, check_startup(args.startup_budget)
+    for size in ([] if args.startup_only else args.sizes):
+        timesheet, pay_rate_file = write_synthetic(payroll.cd / args.data_dir, size, args.seed, args.period_start)
+
+        for engine in args.engines:
+            if engine == "minute" and size > args.minute_max:
+                continue
+            result = run_pipeline(timesheet, pay_rate_file, engine, args.workers)
+            results.setdefault(str(size), {})[engine] = result
+
+            stages = "  ".join(f"{name} {seconds:.3f}" for name, seconds in result["stages"].items() if name != "employee")
+            print(f"{size:>8} {engine:<9} {result['total']:>9.3f}s  {result['digest']}  {stages}")
+
+            # Same outputs across engines ...
+            if result["digest"] != results[str(size)][args.engines[0]]["digest"]:
+                problems.append(f"{size}: {engine} output differs from {args.engines[0]}")
+
+            # ... and across versions
+            previous = baseline.get(str(size), {}).get(engine)
+            if previous:
+                if previous["digest"] != result["digest"]:
+                    problems.append(f"{size}: {engine} output differs from the baseline")
+                if result["total"] > previous["total"] * args.tolerance and result["total"] - previous["total"] > args.min_slowdown:
+                    problems.append(f"{size}: {engine} took {result['total']:.3f}s, baseline {previous['total']:.3f}s")
+
+    if args.save:
+        pathlib.Path(args.save).write_text(json.dumps(results, indent=2))
+
+    print()
+    for problem in problems:
+        print("FAIL : " + problem)
+    print(f"{len(problems)} problem(s)")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
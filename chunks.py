@@ -0,0 +1,62 @@
+import math
+import typing
+import pathlib
+import tempfile
+
+import pandas as pd
+
+import loader
+
+
+# ========================================================================
+# =================        Out-of-core Timesheets        =================
+# ========================================================================
+#
+# A year long, all sites export does not fit in memory as one frame, let
+# alone as minutes.  `partitions` streams the sheet `chunk_rows` rows at a
+# time and spills every chunk to disk split by a hash of the employee's
+# (LAST, FIRST) name, then hands the partitions back one at a time.  A
+# partition holds every row of its employees in sheet order, so overtime
+# never has to be carried from one partition to the next: each one is
+# reduced to per-employee-week hours on its own and gives exactly the
+# rows the in-memory path would have for those employees (with the same
+# row index, so errors point at the right worksheet row).
+#
+# The number of partitions comes from the sheet's declared size (or the
+# file size when it has none), so a partition is about `chunk_rows` rows
+# and peak memory is a chunk plus a partition, whatever the file size.
+
+NAMES = ["Last Name", "First Name"]
+BYTES_PER_ROW = 50   # compressed .xlsx bytes per timesheet row, on the low side so partitions come out smaller, not larger
+
+
+def partition_count(path: pathlib.Path, sheet_name: str, chunk_rows: int) -> int:
+    rows = max(loader.declared_rows(path, sheet_name) or 0, path.stat().st_size // BYTES_PER_ROW)
+    return max(1, math.ceil(rows / chunk_rows))
+
+
+def partition_of(chunk: pd.DataFrame, count: int) -> pd.Series:
+    """ Partition of every row, by its upper case (Last Name, First Name) """
+    names = chunk[NAMES].astype(str).apply(lambda column: column.str.upper())
+    return pd.util.hash_pandas_object(names, index=False) % count
+
+
+def partitions(path: pathlib.Path, sheet_name: str, chunk_rows: int, usecols: typing.Optional[typing.List[str]] = None, parse_dates: typing.Optional[typing.List[str]] = None, optional: typing.Sequence[str] = (), spill_dir: typing.Optional[pathlib.Path] = None) -> typing.Iterator[pd.DataFrame]:
+    """ The rows of a sheet as frames of whole employees, each employee's rows in sheet order """
+    count = partition_count(path, sheet_name, chunk_rows)
+    if spill_dir is not None:
+        spill_dir.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(prefix="payroll-chunks-", dir=spill_dir) as directory:
+        spilled: typing.List[typing.List[pathlib.Path]] = [[] for _ in range(count)]
+        for i, chunk in enumerate(loader.iter_sheet(path, sheet_name, chunk_rows, usecols, parse_dates, optional)):
+            for partition, rows in chunk.groupby(partition_of(chunk, count).to_numpy(), sort=False):
+                part = pathlib.Path(directory) / f"{partition}-{i}.pkl"
+                rows.to_pickle(part)
+                spilled[partition].append(part)
+
+        for parts in spilled:
+            if parts:
+                yield pd.concat([pd.read_pickle(part) for part in parts])
+                for part in parts:
+                    part.unlink()
@@ -0,0 +1,290 @@
+import os
+import re
+import sys
+import typing
+import pathlib
+import zipfile
+import argparse
+import datetime
+import posixpath
+from xml.etree import ElementTree
+
+import tracing
+
+
+# ========================================================================
+# =================            Command Line              =================
+# ========================================================================
+#
+# `python payroll.py` starts here.  Parsing arguments, listing the
+# timesheets to pick from and --verify-pay-rates only need the standard
+# library; pandas, NumPy, pytz and the workbook libraries are imported
+# (with payroll.py) once there is something to calculate.  Nothing touches
+# the disk at import time.
+#
+# --verify-pay-rates reads the pay rate workbook with `xlsx_rows`, a small
+# zipfile + ElementTree reader of cell values, instead of openpyxl, and
+# prints it the way pandas shows the sheet: empty cells as NaN (NaT in date
+# columns), numeric columns with gaps as floats and date formatted cells as
+# dates, so a missing rate stands out just as it did.
+# `python benchmark.py` checks these paths against an import time budget.
+
+cd = pathlib.Path(os.path.dirname(os.path.realpath(__file__)))
+
+# periods.WEEKDAYS, periods.DEFAULT_ANCHOR and timezone.POLICIES, repeated here because those modules import NumPy
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DEFAULT_ANCHOR = "2023-04-02"
+DST_POLICIES = ["raise", "earliest", "latest"]
+
+HEAVY_MODULES = ["pandas", "numpy", "pytz", "openpyxl", "xlsxwriter"]   # never imported by the light paths
+
+XLSX_NS = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+RELATIONSHIP = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+DATE_FORMATS = set(range(14, 23)) | {45, 46, 47}   # built-in number formats that show a date or time
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+
+def excel_files(directory: pathlib.Path = cd) -> typing.List[str]:
+    """ Workbooks in `directory` to pick a timesheet from, without Excel's "~$" lock files """
+    return sorted(f for f in os.listdir(directory) if not f.startswith("~") and f.endswith(".xlsx"))
+
+
+def parse_args(argv: typing.Optional[typing.List[str]] = None):
+    parser = argparse.ArgumentParser()
+
+
+    parser.add_argument("--timesheet", type=str) #, choices=excel_files)
+    parser.add_argument("--timesheet-sheet-name", type=str, default="Entries")
+    parser.add_argument("--list", action="store_true", help="Print the workbooks --timesheet can pick from and exit")
+    parser.add_argument("--batch", type=str, help="Directory or glob of timesheets to process without prompting")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Run the payroll HTTP service on PORT instead of a single timesheet")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--allow-origin", type=str, action="append", metavar="ORIGIN", help="Browser origin allowed to call --serve, repeatable (default: the origins in cors.json)")
+    parser.add_argument("--max-upload-mb", type=float, default=20, help="Largest timesheet --serve accepts, bigger uploads get 413")
+    parser.add_argument("--watch", type=str, metavar="DIR", help="Compute every timesheet dropped into DIR, writing the payroll next to it (see watch.py)")
+    parser.add_argument("--watch-workers", type=int, default=2, help="Worker processes computing watched timesheets")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds a watched file's size and mtime must stay unchanged before it is read")
+    parser.add_argument("--poll", type=float, default=0.5, help="Seconds between scans of the watched directory")
+
+    parser.add_argument("--output-tag", type=str, default=" - Payroll")
+    parser.add_argument("--output-sheet-name", type=str, default="Payroll")
+
+    parser.add_argument("--pay-rate-file", type=str, default="Pay Rate.xlsx")
+    parser.add_argument("--pay-rate-sheet-name", type=str, default="Pay Rate")
+    parser.add_argument("--strict-names", action="store_true", help="Stop before calculating when a timesheet employee has no pay rate or matches more than one")
+    parser.add_argument("--pay-rules", type=str, help="JSON pay rules (buckets, sites, differentials, day windows), see payrules.py")
+
+    parser.add_argument("--engine", type=str, default="interval", choices=["interval", "minute"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--week-start", type=str, default="sunday", choices=WEEKDAYS, help="First day of the overtime workweek")
+    parser.add_argument("--period-anchor", type=str, default=DEFAULT_ANCHOR, help="First day of any pay period (YYYY-MM-DD)")
+    parser.add_argument("--period-weeks", type=int, default=2, help="Workweeks per pay period")
+    parser.add_argument("--dst-policy", type=str, default="raise", choices=DST_POLICIES, help="Shift times a DST switch makes ambiguous or nonexistent: raise, or take the earliest/latest reading (see timezone.py)")
+    parser.add_argument("--incremental", action="store_true", help="Reuse the hours of employees whose rows and pay rates did not change since the last run")
+    parser.add_argument("--chunk-rows", type=int, metavar="N", help="Stream the timesheet N rows at a time for files too large for memory (see chunks.py), same results")
+
+    parser.add_argument("--cache-dir", type=str, default=".payroll_cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--history-dir", type=str, default=".payroll_history", help="Every run's weekly results are appended here, query them with history.py")
+    parser.add_argument("--no-history", action="store_true")
+
+    parser.add_argument("--verify-pay-rates",  action="store_true")
+    parser.add_argument("--verify-output",     action="store_true")
+    parser.add_argument("--cross-check", action="store_true", help="Replay employees through the minute reference engine and stop on any difference to the cent (see crosscheck.py)")
+    parser.add_argument("--cross-check-sample", type=int, default=25, metavar="N", help="Random employees to replay, 0 for all of them")
+    parser.add_argument("--cross-check-seed", type=int, default=0)
+    parser.add_argument("--cross-check-workers", type=int, help="Processes replaying the sample, default one per CPU")
+
+    parser.add_argument("--profile", type=str, metavar="FILE", help="Record stage timings and write them to FILE")
+    parser.add_argument("--profile-format", type=str, default="json", choices=["json", "trace"], help="json summary or Chrome trace events (flame graph viewers)")
+
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.engine == "minute" and args.dst_policy != "raise":
+        parser.error("--engine minute is the pd.date_range reference and always raises on DST ambiguous/nonexistent times")
+    if args.chunk_rows is not None and (args.incremental or args.batch is not None or args.serve is not None or args.watch is not None):
+        parser.error("--chunk-rows streams a single --timesheet, it can not be combined with --incremental, --batch, --serve or --watch")
+    if args.cross_check and (args.engine == "minute" or args.dst_policy != "raise" or args.chunk_rows is not None):
+        parser.error("--cross-check replays the in-memory interval engine's employees through the minute engine, it needs --engine interval, --dst-policy raise and no --chunk-rows")
+    return args
+
+
+# ========================================================================
+# =================         Light Pay Rate Check         =================
+# ========================================================================
+
+def column_number(reference: str) -> int:
+    """ "C7" -> 2 """
+    number = 0
+    for letter in re.match(r"[A-Z]+", reference).group():
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number - 1
+
+
+def date_styles(styles: ElementTree.Element) -> typing.Set[int]:
+    """ Cell style (s="...") indexes whose number format shows a date or time """
+    custom = {}
+    for number_format in styles.iterfind("m:numFmts/m:numFmt", XLSX_NS):
+        code = re.sub(r'"[^"]*"|\\.|\[[^\]]*\]', "", number_format.get("formatCode", ""))   # quoted text, escapes, [Red] and [$-409]
+        custom[int(number_format.get("numFmtId"))] = re.search(r"[dmyhs]", code, re.IGNORECASE) is not None
+    return {i for i, style in enumerate(styles.iterfind("m:cellXfs/m:xf", XLSX_NS)) if custom.get(int(style.get("numFmtId", 0)), int(style.get("numFmtId", 0)) in DATE_FORMATS)}
+
+
+def excel_date(serial: float) -> datetime.datetime:
+    """ Like openpyxl: to the millisecond, with Excel's 1900-02-29 """
+    day, fraction = divmod(serial, 1)
+    return EXCEL_EPOCH + datetime.timedelta(days=day + (0 < serial < 60), milliseconds=round(fraction * 86400 * 1000))
+
+
+def cell_value(cell: ElementTree.Element, shared: typing.List[str], dates: typing.Set[int] = set()):
+    kind = cell.get("t", "n")
+    if kind == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter(f"{{{XLSX_NS['m']}}}t"))
+    value = cell.findtext("m:v", default=None, namespaces=XLSX_NS)
+    if value is None:
+        return ""
+    if kind == "s":
+        return shared[int(value)]
+    if kind == "b":
+        return value == "1"
+    if kind in ("str", "e"):
+        return value
+    number = float(value)
+    if int(cell.get("s", 0)) in dates:
+        return excel_date(number)
+    return int(number) if number.is_integer() else number
+
+
+def xlsx_rows(path: pathlib.Path, sheet_name: str) -> typing.List[typing.List]:
+    """ Cell values of a worksheet, row by row, empty cells as "", date formatted cells as datetime """
+    with zipfile.ZipFile(path) as archive:
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        relations = {relation.get("Id"): relation.get("Target") for relation in ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))}
+        targets = {sheet.get("name"): relations[sheet.get(RELATIONSHIP)] for sheet in workbook.iterfind("m:sheets/m:sheet", XLSX_NS)}
+        if sheet_name not in targets:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+
+        part = lambda target: target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+        shared = []
+        strings = [target for target in relations.values() if target.endswith("sharedStrings.xml")]
+        if strings:
+            shared = ["".join(t.text or "" for t in item.iter(f"{{{XLSX_NS['m']}}}t")) for item in ElementTree.fromstring(archive.read(part(strings[0])))]
+        dates = set()
+        styles = [target for target in relations.values() if target.endswith("styles.xml")]
+        if styles:
+            dates = date_styles(ElementTree.fromstring(archive.read(part(styles[0]))))
+        sheet = ElementTree.fromstring(archive.read(part(targets[sheet_name])))
+
+    rows = []
+    for row in sheet.iterfind("m:sheetData/m:row", XLSX_NS):
+        values = {column_number(cell.get("r")): cell_value(cell, shared, dates) for cell in row.iterfind("m:c", XLSX_NS)}
+        rows.append([values.get(i, "") for i in range(max(values, default=-1) + 1)])
+    while rows and not any(value != "" for value in rows[-1]):
+        rows.pop()
+    return rows
+
+
+def column_text(name: str, values: typing.List) -> typing.List[str]:
+    """ Header and cells of one column as DataFrame.to_string shows them: empty cells are NaN (NaT among dates), numbers with
+    gaps are floats, every cell but a date starts with a space and so does the header of a number or boolean column """
+    present = [value for value in values if value != ""]
+    if present and all(isinstance(value, datetime.datetime) for value in present):
+        shown = (lambda value: value.isoformat(" ", "seconds")) if any(value.time() != datetime.time() for value in present) else (lambda value: value.date().isoformat())
+        return [name] + [shown(value) if value != "" else "NaT" for value in values]
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present) and (len(present) < len(values) or any(isinstance(value, float) for value in present)):
+        decimals = max([1] + [len(f"{value:.6f}".rstrip("0").split(".")[1]) for value in present])
+        return [f" {name}"] + [f" {value:.{decimals}f}" if value != "" else " NaN" for value in values]
+    numeric = len(present) == len(values) and (all(isinstance(value, bool) for value in values) or all(isinstance(value, int) and not isinstance(value, bool) for value in values))
+    return [f" {name}" if numeric else name] + [f" {value}" if value != "" else " NaN" for value in values]
+
+
+def table(rows: typing.List[typing.List]) -> str:
+    """ First row as the header, right aligned columns with a row number, like DataFrame.to_string """
+    width = max(map(len, rows))
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    columns = [[""] + [str(i) for i in range(len(rows) - 1)]]
+    columns += [column_text(str(rows[0][column]) if rows[0][column] != "" else f"Unnamed: {column}", [row[column] for row in rows[1:]]) for column in range(width)]
+    widths = [max(map(len, column)) for column in columns]
+    return "\n".join(" ".join(column[i].rjust(widths[j]) if j else column[i].ljust(widths[j]) for j, column in enumerate(columns)) for i in range(len(rows)))
+
+
+def verify_pay_rates(args):
+    print(table(xlsx_rows(cd / args.pay_rate_file, args.pay_rate_sheet_name)))
+
+
+# ========================================================================
+# =================                Main                  =================
+# ========================================================================
+
+def main():
+    args, pause = None, True
+    try:
+        args = parse_args()
+        tracing.configure(profile=args.profile is not None, verbose=args.verbose)
+
+        if args.list:
+            print("\n".join(excel_files()))
+            return
+
+        if args.verify_pay_rates:
+            verify_pay_rates(args)
+            return
+
+        if args.batch is not None:
+            import payroll
+            if payroll._batch(args):
+                raise SystemExit(1)
+            return
+
+        if args.serve is not None:
+            import service
+            service.serve(args)
+            return
+
+        if args.watch is not None:
+            import watch
+            watch.watch(args)
+            return
+
+        if args.timesheet is None:
+            files = excel_files()
+
+            for i, f in enumerate(files):
+                print(f"{i}: {f}")
+
+            print()
+
+            args.timesheet = files[int(input(f"Select a file (0-{len(files)-1}) >>> "))]
+
+        print()
+
+        import payroll
+        payroll._main(args)
+
+        print()
+
+    except SystemExit:
+        pause = False   # --help, argument errors and failed batches end without waiting
+        raise
+
+    except Exception as e:
+        print("ERROR : " + str(e))
+        print()
+        raise ValueError(str(e))
+
+    finally:
+        if args is not None and args.profile is not None:
+            tracing.print_summary()
+            tracing.export(args.profile, args.profile_format)
+
+        # Keep the console window of a double-clicked run open, never wait on a pipe or a script
+        if pause and sys.stdin.isatty() and (args is None or not (args.list or args.verify_pay_rates or args.batch is not None or args.serve is not None or args.watch is not None)):
+            try:
+                input("Press Enter to exit ...")
+            except EOFError:
+                pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import io
+import os
+import sys
+import typing
+import argparse
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+import payroll
+import payrules
+
+
+# ========================================================================
+# =================      Minute Reference Cross-check    =================
+# ========================================================================
+#
+# The minute engine (calcPerson / calcShift, one row per worked minute) is
+# the calculation the accountants trust.  `--cross-check` replays a random
+# sample of the timesheet's employees (--cross-check-sample, 0 for all of
+# them) through it on a process pool and compares every hours column and
+# every "<column> Pay" of every sampled employee-week with what the fast
+# engine produced, to the cent.  Any difference stops the run before the
+# payroll workbook is written.
+#
+#   python payroll.py --timesheet "Timesheets - Apr 2 - Apr 15, 2023.xlsx" --cross-check
+#
+# Run as a script it is the test harness: every timesheet given (default:
+# the timesheets/ directory) and optional synthetic timesheets from
+# benchmark.py, all employees by default, exit status 1 on any difference.
+#
+#   python crosscheck.py --synthetic 100 1000
+
+NAMES = ["Last Name", "First Name"]
+INDEX = NAMES + ["Week"]
+SHOWN = 20   # discrepancy rows printed
+
+
+def sample_employees(sheet: pd.DataFrame, sample: int = 0, seed: int = 0) -> pd.MultiIndex:
+    """ `sample` random (Last Name, First Name) of the sheet, sorted, all of them when sample is 0 """
+    employees = pd.MultiIndex.from_frame(sheet[NAMES].dropna().drop_duplicates()).sort_values()
+    if 0 < sample < len(employees):
+        employees = employees[np.sort(np.random.default_rng(seed).choice(len(employees), sample, replace=False))]
+    return employees
+
+
+def reference_hours(sheet: pd.DataFrame, employees: pd.MultiIndex, workers: int, calendar, rules: payrules.PayRules = payrules.DEFAULT) -> pd.DataFrame:
+    """ Minute engine hours of `employees`, indexed and summed like the payroll's g """
+    rows = pd.MultiIndex.from_frame(sheet[NAMES]).isin(employees)
+    return payroll.calc_hours_parallel(sheet[rows], "minute", workers, "raise", calendar, rules).groupby(INDEX).sum()
+
+
+def compare(g: pd.DataFrame, reference: pd.DataFrame, rules: payrules.PayRules = payrules.DEFAULT) -> typing.Tuple[pd.DataFrame, pd.DataFrame]:
+    """ (per column summary, every differing employee-week and column) of g against the reference hours
+
+    Hours and pay are compared rounded to the cent; an employee-week only one side has counts as all zeros on the other.
+    """
+    pay_columns = [f"{column} Pay" for column in rules.columns]
+    index = reference.index.union(g.index[g.index.droplevel("Week").isin(reference.index.droplevel("Week").unique())])
+
+    rates = g[rules.rate_columns].groupby(NAMES).first()
+    reference = reference.reindex(index, fill_value=0.0)
+    reference = pd.concat([reference[rules.columns], rules.pay(reference, rates.reindex(index.droplevel("Week")).set_axis(index, axis=0))], axis=1)
+    fast = g.reindex(index)[rules.columns + pay_columns].fillna({column: 0.0 for column in rules.columns})
+
+    a, b = fast.to_numpy(dtype=float), reference[rules.columns + pay_columns].to_numpy(dtype=float)
+    differs = (np.round(a - b, 2) != 0) & ~(np.isnan(a) & np.isnan(b))
+
+    summary = pd.DataFrame({
+        "Checked": len(index),
+        "Differing": differs.sum(axis=0),
+        "Max Diff": np.where(differs, np.abs(a - b), 0).max(axis=0, initial=0),
+    }, index=pd.Index(rules.columns + pay_columns, name="Column"))
+
+    row, column = np.nonzero(differs)
+    details = pd.DataFrame({"Column": np.array(rules.columns + pay_columns)[column], "Fast": a[row, column], "Reference": b[row, column]}, index=index[row])
+    details["Diff"] = (details["Fast"] - details["Reference"]).round(2)
+    return summary, details
+
+
+def cross_check(sheet: pd.DataFrame, g: pd.DataFrame, args) -> int:
+    """ Print the --cross-check report of a payroll run, returns the number of differing values """
+    employees = sample_employees(sheet, args.cross_check_sample, args.cross_check_seed)
+    workers = args.cross_check_workers or os.cpu_count() or 1
+    rules = payroll.pay_rules(args)
+
+    reference = reference_hours(sheet, employees, workers, payroll.pay_calendar(args), rules)
+    summary, details = compare(g, reference, rules)
+
+    print("\n\n=====  Cross-check  =====")
+    print(f"{len(employees)} employees ({summary['Checked'].iloc[0]} employee-weeks) replayed through the minute engine")
+    print(summary.to_string())
+    if len(details):
+        print(details.head(SHOWN).to_string())
+        if len(details) > SHOWN:
+            print(f"... {len(details) - SHOWN} more")
+    print(f"{len(details)} value(s) differ")
+    return len(details)
+
+
+# ========================================================================
+# =================               Harness                =================
+# ========================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cross-check the interval engine against the minute reference on many timesheets")
+    parser.add_argument("timesheets", type=str, nargs="*", default=["timesheets"], help="Timesheet files, directories or globs")
+    parser.add_argument("--synthetic", type=int, nargs="+", default=[], metavar="SHIFTS", help="Also check benchmark.py synthetic timesheets of these sizes")
+    parser.add_argument("--period-start", type=str, nargs="+", default=["2023-10-29", "2024-03-03", "2023-12-24"], help="Synthetic pay periods (default: fall back, spring forward, New Year)")
+    parser.add_argument("--sample", type=int, default=0, help="Employees replayed per timesheet, 0 for all")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    run_args = payroll.parse_args(["--no-cache", "--no-history", "--cross-check", "--cross-check-sample", str(args.sample), "--cross-check-seed", str(args.seed)] + ([] if args.workers is None else ["--cross-check-workers", str(args.workers)]))
+
+    cases = [(path, payroll.cd / run_args.pay_rate_file) for pattern in args.timesheets for path in payroll.batch_files(pattern, run_args)]
+    if args.synthetic:
+        import benchmark
+        cases += [benchmark.write_synthetic(payroll.cd / "bench_data", size, 0, period_start) for size in args.synthetic for period_start in args.period_start]
+
+    results = []
+    for timesheet, pay_rate_file in cases:
+        try:
+            sheet = payroll.read_timesheet(timesheet)
+        except ValueError as e:
+            results.append((timesheet.name, "SKIPPED", str(e)))   # not a timesheet export
+            continue
+
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                g, d, hours_output, pay_output = payroll.calc_payroll(sheet, payroll.read_pay_rates(pay_rate_file), run_args)
+            differing = cross_check(sheet, g, run_args)
+            results.append((timesheet.name, "OK" if differing == 0 else "DIFFERS", f"{differing} value(s) differ"))
+        except Exception as e:
+            results.append((timesheet.name, "FAILED", str(e)))
+
+    summary = pd.DataFrame(results, columns=["Timesheet", "Status", "Detail"])
+    print("\n\n=====  Cross-check Harness  =====")
+    print(summary.to_string(index=False))
+    return 1 if summary["Status"].isin(["DIFFERS", "FAILED"]).any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import sys
+import time
+import typing
+import hashlib
+import pathlib
+import argparse
+import functools
+
+import numpy as np
+import pandas as pd
+
+import loader
+import periods
+
+
+# ========================================================================
+# =================        Historical Payroll Store        ===============
+# ========================================================================
+#
+# Every run appends its per-employee, per-week frame `g` to a directory
+# partitioned by pay period:
+#
+#   .payroll_history/period=2023-04-02/<run ns>-<period end>-<source>.npz
+#
+# Parts are never rewritten.  A timesheet that is run again appends a new
+# part, and a query drops every older part of that timesheet whose pay
+# period overlaps the new one, and every employee's rows from older parts
+# whose pay period overlaps a newer part holding that employee, whatever
+# timesheet (or pay calendar) the newer part came from.  So history
+# reflects the last run of every timesheet, employee and period, and a
+# period re-run from a copy of its timesheet or under another
+# --period-anchor is never counted twice.  Parts are loader .npz frames
+# (one array per column), a query opens only the parts of its date range
+# (and the newer parts overlapping them) and reads only the columns it
+# needs.  `d` is the sum of `g` per employee, so it is not stored
+# separately.
+#
+#   python history.py ytd 2023
+#   python history.py employee SEALII FANNY
+#   python history.py compare 2023-04-02 2023-04-16
+
+NAMES = ["Last Name", "First Name"]
+DEFAULT_COLUMNS = ["Total Hours", "Total OT", "Pay", "Pay_OT"]
+
+
+def source_key(source: str) -> str:
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+def append(directory: pathlib.Path, g: pd.DataFrame, calendar: periods.PayCalendar, source: str) -> typing.List[pathlib.Path]:
+    """ Add g (indexed by Last Name, First Name, Week) as one part per pay period """
+    frame = g.reset_index()
+    week = frame["Week"].to_numpy(dtype=np.int64)
+    frame.insert(3, "Week Start", calendar.week_start_date(week).astype("datetime64[ns]"))
+    period = calendar.period(week)
+    period_start = calendar.week_start_date(period * calendar.weeks_per_period)
+    period_end = calendar.week_start_date((period + 1) * calendar.weeks_per_period)
+
+    run = time.time_ns()
+    parts = []
+    for start in np.unique(period_start):
+        partition = directory / f"period={start}"
+        partition.mkdir(parents=True, exist_ok=True)
+        rows = period_start == start
+        part = partition / f"{run}-{period_end[rows][0]}-{source_key(source)}.npz"
+        loader.save_frame(frame[rows].reset_index(drop=True), part)
+        parts.append(part)
+    return parts
+
+
+def catalog(directory: pathlib.Path) -> typing.List[typing.Tuple[int, str, str, str, pathlib.Path]]:
+    """ (run, period start, period end, source, path) of every part, from the file names alone """
+    parts = []
+    for part in directory.glob("period=*/*.npz"):
+        start = part.parent.name.split("=", 1)[1]
+        run, year, month, day, source = part.stem.split("-")
+        parts.append((int(run), start, f"{year}-{month}-{day}", source, part))
+    return sorted(parts)
+
+
+def superseded(parts: typing.List[typing.Tuple[int, str, str, str, pathlib.Path]], part: typing.Tuple[int, str, str, str, pathlib.Path], names: typing.Callable[[pathlib.Path], pd.MultiIndex]) -> pd.MultiIndex:
+    """ Employees of `part` that newer parts with an overlapping pay period replace, all of them when one is from the same source """
+    run, start, end, source, path = part
+    newer = [(other_source, other_path) for other, other_start, other_end, other_source, other_path in parts if other > run and other_start < end and other_end > start]
+    if any(other_source == source for other_source, _ in newer):
+        return names(path)
+    return functools.reduce(pd.MultiIndex.union, [names(other_path) for _, other_path in newer], pd.MultiIndex.from_arrays([[], []], names=NAMES))
+
+
+def read(directory: pathlib.Path, columns: typing.List[str], start: typing.Optional[str] = None, end: typing.Optional[str] = None, period: typing.Optional[str] = None) -> pd.DataFrame:
+    """ Names, Week Start and `columns` of every current week in the parts whose pay period overlaps [start, end), or starts on `period` """
+    wanted = NAMES + ["Week Start"] + columns
+    parts = catalog(directory)
+    names = functools.lru_cache(maxsize=None)(lambda path: pd.MultiIndex.from_frame(loader.load_frame(path, NAMES)[NAMES]).unique())
+
+    frames = []
+    for part in parts:
+        if (start is None or part[2] > start) and (end is None or part[1] < end) and (period is None or part[1] == period):
+            frame = loader.load_frame(part[4], wanted)
+            frames.append(frame[~pd.MultiIndex.from_frame(frame[NAMES]).isin(superseded(parts, part, names))])
+    if not frames:
+        empty = {**{name: pd.Series(dtype=object) for name in NAMES}, "Week Start": pd.Series(dtype="datetime64[ns]"), **{column: pd.Series(dtype=float) for column in columns}}
+        return pd.DataFrame(empty)
+    return pd.concat(frames, ignore_index=True)
+
+
+# ========================================================================
+# =================               Queries                =================
+# ========================================================================
+
+def ytd(directory: pathlib.Path, year: int, columns: typing.List[str] = DEFAULT_COLUMNS, through: typing.Optional[str] = None) -> pd.DataFrame:
+    """ Totals per employee of the weeks starting in `year` (up to `through`) """
+    end = through or f"{year + 1}-01-01"
+    weeks = read(directory, columns, start=f"{year}-01-01", end=end)   # periods overlapping the year may hold weeks of the year before or after
+    weeks = weeks[(weeks["Week Start"] >= f"{year}-01-01") & (weeks["Week Start"] < end)]
+    return weeks.groupby(NAMES)[columns].sum()
+
+
+def employee(directory: pathlib.Path, last: str, first: str, columns: typing.List[str] = DEFAULT_COLUMNS) -> pd.DataFrame:
+    """ Week by week history of one employee """
+    weeks = read(directory, columns)
+    mine = (weeks["Last Name"] == last.upper()) & (weeks["First Name"] == first.upper())
+    return weeks[mine].groupby("Week Start")[columns].sum()
+
+
+def compare(directory: pathlib.Path, period_a: str, period_b: str, columns: typing.List[str] = DEFAULT_COLUMNS) -> pd.DataFrame:
+    """ Per employee totals of two pay periods side by side, and b - a """
+    totals = []
+    for period in (period_a, period_b):
+        weeks = read(directory, columns, period=period)
+        totals.append(weeks.groupby(NAMES)[columns].sum())
+    a, b = totals
+    return pd.concat({period_a: a, period_b: b, "Change": b.sub(a, fill_value=0)}, axis=1).fillna(0)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query the payroll history written by payroll.py runs")
+    parser.add_argument("--history-dir", type=str, default=".payroll_history")
+    parser.add_argument("--columns", type=str, nargs="+", default=DEFAULT_COLUMNS)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("ytd", help="Year to date totals per employee")
+    query.add_argument("year", type=int)
+    query.add_argument("--through", type=str, help="Only weeks starting before this date (YYYY-MM-DD)")
+
+    query = commands.add_parser("employee", help="Week by week history of one employee")
+    query.add_argument("last")
+    query.add_argument("first")
+
+    query = commands.add_parser("compare", help="Compare two pay periods by their first day")
+    query.add_argument("period_a")
+    query.add_argument("period_b")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    directory = pathlib.Path(__file__).resolve().parent / args.history_dir
+
+    st = time.perf_counter()
+    if args.command == "ytd":
+        result = ytd(directory, args.year, args.columns, args.through)
+    elif args.command == "employee":
+        result = employee(directory, args.last, args.first, args.columns)
+    else:
+        result = compare(directory, args.period_a, args.period_b, args.columns)
+
+    print(result.round(2).to_string())
+    print(f"\n{len(result)} rows in {time.perf_counter() - st:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import typing
+
+import numpy as np
+import pandas as pd
+
+import tracing
+import periods
+import payrules
+import timezone
+
+
+# ========================================================================
+# =================     Closed-form Interval Engine      =================
+# ========================================================================
+#
+# Every shift is the half-open range of whole minutes [start, end) in UTC
+# epoch minutes, exactly the minutes `pd.date_range(start, end, freq="min",
+# tz='America/Denver')[:-1]` produced.  Instead of materialising those minutes we split
+# the range into pieces with a constant UTC offset and a constant pay
+# calendar workweek, and count day minutes over each piece with arithmetic.
+#
+# The whole timesheet is processed at once: every step below is a NumPy
+# operation over all pieces of all employees, there is no per-employee,
+# per-week or per-shift Python callback.
+
+MINUTES_PER_DAY = 24 * 60
+FORTY = 40 * 60
+
+
+def day_minutes_before(wall: np.ndarray, day_start: np.ndarray, day_end: np.ndarray) -> np.ndarray:
+    """ Number of wall-clock minutes in [0, wall) that fall inside the [day_start, day_end) window """
+    days, rem = np.divmod(wall, MINUTES_PER_DAY)
+    return days * (day_end - day_start) + np.clip(rem - day_start, 0, day_end - day_start)
+
+
+def day_minutes(wall_start: np.ndarray, wall_end: np.ndarray, day_start: np.ndarray, day_end: np.ndarray) -> np.ndarray:
+    return day_minutes_before(wall_end, day_start, day_end) - day_minutes_before(wall_start, day_start, day_end)
+
+
+def pieces(start: np.ndarray, end: np.ndarray, calendar: periods.PayCalendar, zone: timezone.Zone = timezone.zone()) -> typing.Tuple[np.ndarray, ...]:
+    """ Split [start, end) UTC minutes into pieces with one offset and one week each
+
+    Returns (shift, week, start, end, offset) arrays, pieces of a shift in time order.
+    """
+    transitions = np.append(zone.transitions, np.iinfo(np.int64).max)
+    shift = np.arange(len(start))
+    keep = start < end
+    shift, start, end = shift[keep], start[keep], end[keep]
+
+    out = []
+    while len(shift):
+        i = zone.index(start)
+        offset = zone.offsets[i]
+        next_transition = transitions[i + 1]
+
+        week, boundary = calendar.week(start + offset)
+        stop = np.minimum(np.minimum(end, next_transition), boundary - offset)
+        out.append((shift, week, start, stop, offset))
+
+        more = stop < end
+        shift, start, end = shift[more], stop[more], end[more]
+
+    if not out:
+        return tuple(np.empty(0, dtype=np.int64) for _ in range(5))
+    return tuple(np.concatenate(column) for column in zip(*out))
+
+
+def group_ids(*keys: np.ndarray) -> np.ndarray:
+    """ Consecutive group numbers for already sorted keys """
+    if len(keys[0]) == 0:
+        return np.empty(0, dtype=np.int64)
+    changed = np.zeros(len(keys[0]), dtype=bool)
+    for key in keys:
+        changed[1:] |= key[1:] != key[:-1]
+    return np.cumsum(changed)
+
+
+def calc_shifts(table, calendar: periods.PayCalendar, rules: payrules.PayRules = payrules.DEFAULT) -> pd.DataFrame:
+    """ Day/Night/OT hours for every employee and workweek of a shifts.ShiftTable
+
+    Same result as `sheet.groupby(["Last Name", "First Name"]).apply(calcPerson)`:
+    the rules.columns hour columns indexed by (Last Name, First Name, Week).
+    """
+    person = table.records["employee"].astype(np.int64)
+    site = np.append(rules.site_codes(table.schedules), 0)[table.records["schedule"]]   # code -1 (no schedule) -> site 0
+    columns = len(rules.columns)
+
+    with tracing.span("expand", shifts=len(table)) as s:
+        row, week, start, end, offset = pieces(table.records["start"], table.records["end"], calendar)
+        s.set(pieces=len(row))
+
+    # Minutes of a week are counted in shift (sheet row) order
+    ot_span = tracing.start("ot split", pieces=len(row))
+    order = np.lexsort((start, row, week, person[row]))
+    row, week, start, end, offset = row[order], week[order], start[order], end[order], offset[order]
+    week_id = group_ids(person[row], week)
+    weeks = week_id.max() + 1 if len(week_id) else 0
+    week_begin = np.searchsorted(week_id, np.arange(weeks))
+    week_person, week_number = row[week_begin], week[week_begin]
+
+    # The 40 hour cutoff is the 2401st worked minute of the week
+    length = end - start
+    worked_after = np.cumsum(length)
+    worked_after -= np.repeat(worked_after[week_begin] - length[week_begin], np.diff(np.append(week_begin, len(week_id))))
+    worked_before = worked_after - length
+
+    crosses = (worked_before <= FORTY) & (worked_after > FORTY)
+    cutoff = np.full(weeks, np.iinfo(np.int64).max)
+    cutoff[week_id[crosses]] = start[crosses] + (FORTY - worked_before[crosses])
+    split = np.clip(cutoff[week_id], start, end)
+    ot_span.stop()
+
+    # Minutes and day minutes per (week, overtime, shift)
+    classify_span = tracing.start("classify", weeks=weeks)
+    is_ot = np.concatenate([np.zeros(len(row), dtype=bool), np.ones(len(row), dtype=bool)])
+    a, b = np.concatenate([start, split]), np.concatenate([split, end])
+    week_id, row, offset = np.tile(week_id, 2), np.tile(row, 2), np.tile(offset, 2)
+    keep = a < b
+    is_ot, a, b, week_id, row, offset = is_ot[keep], a[keep], b[keep], week_id[keep], row[keep], offset[keep]
+
+    order = np.lexsort((row, is_ot, week_id))
+    is_ot, a, b, week_id, row, offset = is_ot[order], a[order], b[order], week_id[order], row[order], offset[order]
+    shift_id = group_ids(week_id, is_ot, row)
+    first = np.searchsorted(shift_id, np.arange(shift_id.max() + 1 if len(shift_id) else 0))
+
+    minutes  = np.bincount(shift_id, weights=b - a)
+    day_mins = np.bincount(shift_id, weights=day_minutes(a + offset, b + offset, rules.day_start[site[row]], rules.day_end[site[row]]))
+
+    # Round each shift like a timesheet line, then total the week
+    regular = np.round(minutes / 60, 2)
+    day = np.round(day_mins / 60, 2)
+    night = regular - day
+
+    base = week_id[first] * columns + len(payrules.BUCKETS) * site[row[first]] + 2 * is_ot[first]
+    hours = np.bincount(np.concatenate([base, base + 1]), weights=np.concatenate([day, night]), minlength=weeks * columns)
+    hours = np.round(hours.reshape(weeks, columns), 2)
+    classify_span.stop()
+
+    regular_hours = hours[:, [rules.columns.index(column) for column in rules.bucket_columns("Day") + rules.bucket_columns("Night")]].sum(axis=1)
+    assert (np.round(regular_hours, 1) <= 40).all(), "Sum of Day and Night are not less than 40: " + str(regular_hours.max())
+
+    last_names, first_names = table.employee_names(person[week_person])
+    index = pd.MultiIndex.from_arrays([last_names, first_names, week_number], names=["Last Name", "First Name", "Week"])
+    return pd.DataFrame(hours, index=index, columns=rules.columns)
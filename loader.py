@@ -0,0 +1,222 @@
+import os
+import json
+import typing
+import hashlib
+import pathlib
+import itertools
+
+import numpy as np
+import pandas as pd
+import openpyxl
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.io.parsers import TextParser
+
+
+# ========================================================================
+# =================     Streaming Excel + Sheet Cache    =================
+# ========================================================================
+#
+# `read_sheet` gives the same frame as `pd.read_excel(..., usecols=...,
+# parse_dates=...)` but walks the worksheet once in read-only mode and
+# only converts the wanted columns.  Parsed frames are kept in a cache
+# directory as NumPy .npz files (one array per column), keyed by the
+# content hash of the workbook plus the read parameters.  The path ->
+# (mtime, size, hash) index means unchanged files are not even re-hashed.
+# `iter_sheet` walks a worksheet the same way a chunk of rows at a time,
+# for timesheets too large to hold (see chunks.py).
+
+CACHE_VERSION = 1
+INDEX_FILE = "index.json"
+
+
+def convert_cell(cell):
+    """ Same conversion pandas' openpyxl reader applies """
+    if cell.value is None:
+        return ""
+    elif cell.data_type == TYPE_ERROR:
+        return np.nan
+    elif cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        if val == cell.value:
+            return val
+    return cell.value
+
+
+def sheet_rows(workbook, sheet_name: str, usecols: typing.Optional[typing.List[str]] = None, optional: typing.Sequence[str] = ()) -> typing.Tuple[typing.List, typing.Iterator[typing.Tuple[typing.List, bool]]]:
+    """ Header of the wanted columns, and (converted cells, row has data) for every row after it """
+    if sheet_name not in workbook.sheetnames:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    sheet = workbook[sheet_name]
+    sheet.reset_dimensions()
+    rows = sheet.iter_rows()
+
+    header = [convert_cell(cell) for cell in next(rows, ())]
+    if usecols is None:
+        indices = list(range(len(header)))
+    else:
+        missing = [column for column in usecols if column not in header]
+        if missing:
+            raise ValueError(f"Usecols do not match columns, columns expected but not found: {missing}")
+        indices = sorted(header.index(column) for column in [*usecols, *(column for column in optional if column in header)])
+
+    converted = (([convert_cell(row[i]) if i < len(row) else "" for i in indices], any(cell.value is not None for cell in row)) for row in rows)
+    return [header[i] for i in indices], converted
+
+
+def parse_sheet(path: typing.Union[pathlib.Path, typing.BinaryIO], sheet_name: str, usecols: typing.Optional[typing.List[str]] = None, parse_dates: typing.Optional[typing.List[str]] = None, optional: typing.Sequence[str] = ()) -> pd.DataFrame:
+    """ `optional` columns are read along with usecols when the sheet has them """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        header, rows = sheet_rows(workbook, sheet_name, usecols, optional)
+        data = [header]
+        last_row_with_data = 0
+        for row, has_data in rows:
+            data.append(row)
+            if has_data:
+                last_row_with_data = len(data) - 1
+    finally:
+        workbook.close()
+
+    parser = TextParser(data[: last_row_with_data + 1], header=0, skip_blank_lines=False, parse_dates=parse_dates or False)
+    return parser.read()
+
+
+def iter_sheet(path: pathlib.Path, sheet_name: str, chunk_rows: int, usecols: typing.Optional[typing.List[str]] = None, parse_dates: typing.Optional[typing.List[str]] = None, optional: typing.Sequence[str] = ()) -> typing.Iterator[pd.DataFrame]:
+    """ parse_sheet in frames of at most `chunk_rows` rows, only one chunk of cells is held at a time
+
+    Chunks without data are skipped and trailing empty rows of a chunk are dropped.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        header, rows = sheet_rows(workbook, sheet_name, usecols, optional)
+        first = 0   # frame index of the chunk's first row, the index runs on across chunks like parse_sheet's
+        while True:
+            data, last_row_with_data = [header], 0
+            for row, has_data in itertools.islice(rows, chunk_rows):
+                data.append(row)
+                if has_data:
+                    last_row_with_data = len(data) - 1
+            if len(data) == 1:
+                break
+            if last_row_with_data:
+                frame = TextParser(data[: last_row_with_data + 1], header=0, skip_blank_lines=False, parse_dates=parse_dates or False).read()
+                frame.index += first
+                yield frame
+            first += len(data) - 1
+    finally:
+        workbook.close()
+
+
+def declared_rows(path: pathlib.Path, sheet_name: str) -> typing.Optional[int]:
+    """ Row count from the worksheet's dimension record, None when the file does not declare one """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        return workbook[sheet_name].max_row if sheet_name in workbook.sheetnames else None
+    finally:
+        workbook.close()
+
+
+# ========================================================================
+# =================          .npz Frame Storage          =================
+# ========================================================================
+
+def save_frame(frame: pd.DataFrame, path: pathlib.Path):
+    """ One array per column; object columns must be strings (missing values are masked) """
+    arrays, dtypes = {}, []
+    for i, column in enumerate(frame.columns):
+        values = frame[column].to_numpy()
+        if values.dtype.kind == 'O':
+            missing = pd.isna(values)
+            if not all(isinstance(value, str) for value in values[~missing]):
+                raise TypeError(f"Column {column!r} is not cacheable")
+            arrays[f"m{i}"] = missing
+            values = np.where(missing, "", values).astype(str)
+        elif values.dtype.kind in 'Mm':
+            values = values.view(np.int64)
+        dtypes.append(str(frame[column].dtype))
+        arrays[f"c{i}"] = values
+
+    arrays["__meta__"] = np.array(json.dumps({"version": CACHE_VERSION, "columns": list(map(str, frame.columns)), "dtypes": dtypes}))
+
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def load_frame(path: pathlib.Path, columns: typing.Optional[typing.List[str]] = None) -> pd.DataFrame:
+    """ `columns` reads only those arrays from the file (in file order), missing ones are skipped """
+    with np.load(path) as data:
+        meta = json.loads(str(data["__meta__"]))
+        wanted = meta["columns"] if columns is None else [column for column in meta["columns"] if column in columns]
+        arrays = {}
+        for i, (column, dtype) in enumerate(zip(meta["columns"], meta["dtypes"])):
+            if column not in wanted:
+                continue
+            values = data[f"c{i}"]
+            if dtype == "object":
+                values = values.astype(object)
+                values[data[f"m{i}"]] = np.nan
+            else:
+                values = values.view(dtype) if dtype.startswith(("datetime64", "timedelta64")) else values.astype(dtype)
+            arrays[column] = values
+    return pd.DataFrame(arrays, columns=wanted)
+
+
+# ========================================================================
+# =================              Cache Keys              =================
+# ========================================================================
+
+def file_hash(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(path: pathlib.Path, cache_dir: pathlib.Path) -> str:
+    """ Hash of the file, re-computed only when its mtime or size changed """
+    index_file = cache_dir / INDEX_FILE
+    try:
+        index = json.loads(index_file.read_text())
+    except (OSError, ValueError):
+        index = {}
+
+    stat = path.stat()
+    key = str(path.resolve())
+    entry = index.get(key)
+    if entry and entry[:2] == [stat.st_mtime_ns, stat.st_size]:
+        return entry[2]
+
+    index[key] = [stat.st_mtime_ns, stat.st_size, file_hash(path)]
+    tmp = index_file.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(index, indent=1))
+    os.replace(tmp, index_file)
+    return index[key][2]
+
+
+def cache_file(path: pathlib.Path, cache_dir: pathlib.Path, *params) -> pathlib.Path:
+    params = hashlib.sha256(json.dumps([CACHE_VERSION, *params]).encode()).hexdigest()[:16]
+    return cache_dir / f"{content_hash(path, cache_dir)}-{params}.npz"
+
+
+def read_sheet(path: typing.Union[pathlib.Path, typing.BinaryIO], sheet_name: str, usecols: typing.Optional[typing.List[str]] = None, parse_dates: typing.Optional[typing.List[str]] = None, cache_dir: typing.Optional[pathlib.Path] = None, optional: typing.Sequence[str] = ()) -> pd.DataFrame:
+    """ parse_sheet through the cache, `cache_dir=None` always parses the workbook """
+    if cache_dir is None:
+        return parse_sheet(path, sheet_name, usecols, parse_dates, optional)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cached = cache_file(path, cache_dir, sheet_name, usecols, parse_dates, list(optional))
+    if cached.exists():
+        try:
+            return load_frame(cached)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    frame = parse_sheet(path, sheet_name, usecols, parse_dates, optional)
+    try:
+        save_frame(frame, cached)
+    except (OSError, TypeError):
+        pass
+    return frame
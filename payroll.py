@@ -1,305 +1,489 @@
-import os
+import sys
+
+# `python payroll.py` is the command line in cli.py, which imports this module only once there is something to calculate
+if __name__ == "__main__":
+    import cli
+    sys.exit(cli.main())
+
 import math
-import pytz
 import typing
+import hashlib
 import pathlib
-import argparse
+import itertools
+import collections
 import numpy as np
 import pandas as pd
+import xlsxwriter
+import loader
+import tracing
+import shifts
+import periods
+import payrules
+import registry
+import history
+import intervals
+import chunks
 pd.set_option('display.max_columns', None)
 # pd.set_option('display.max_rows', None)
 from datetime import datetime, timedelta, date, time
+from concurrent.futures import ProcessPoolExecutor
+from cli import cd, parse_args
 
 
-cd = pathlib.Path(os.path.dirname(os.path.realpath(__file__)))
-files = os.listdir(cd)
-excel_files = list(filter(lambda x: not x.startswith("~") and x.endswith(".xlsx"), files))
+def p(x, prefix=None, func=lambda x: x, dont=False):
+    if not tracing.VERBOSE: return x
+    tracing.debug(func(x), prefix=prefix)
+    if not dont: input("...")
+    return x
 
+def floor(x):
+    return math.floor(x * 100) / 100
 
-def parse_args():
-    parser = argparse.ArgumentParser()
 
+# ========================================================================
+# =================      Minute Reference Engine      =====================
+# ========================================================================
 
-    parser.add_argument("--timesheet", type=str) #, choices=excel_files)
-    parser.add_argument("--timesheet-sheet-name", type=str, default="Entries")
+freq, toHours, forty = "min", (60), (40 * 60)
 
-    parser.add_argument("--output-tag", type=str, default=" - Payroll")
-    parser.add_argument("--output-sheet-name", type=str, default="Payroll")
+def person_to_minutes(person):
+    sum_regular = 0
 
-    parser.add_argument("--pay-rate-file", type=str, default="Pay Rate.xlsx")
-    parser.add_argument("--pay-rate-sheet-name", type=str, default="Pay Rate")
 
-    parser.add_argument("--verify-pay-rates",  action="store_true")
-    parser.add_argument("--verify-output",     action="store_true")
+    start_times = pd.to_datetime(person["Start Time"]).dt.floor('min')
+    end_times   = pd.to_datetime(person["End Time"])
+    df = pd.DataFrame(columns=['shift', 'First Name', 'Last Name', 'date', 'Start Time', 'End Time', 'Schedule'])
+    for shift, (firstName, lastName, start, end, schedule, regular) in enumerate(zip(person["First Name"], person["Last Name"], start_times, end_times, person["Schedule"], person["Regular"])):
+        rng = pd.date_range(start, end, freq=freq, tz='America/Denver')  # [:-1]
+        # regular = round(len(rng) / 60, 2)
+        
+        # minutes = rng.time
+        # day = round((np.floor(((minutes   >= day_start) & (minutes   < day_end)).sum() * 100) / 100) / 60, 2)
+        # night = regular - day
 
-    parser.add_argument("-v", "--verbose", action="store_true")
-    return parser.parse_args()
+        # p_minutes = shift[shift["Schedule"] == "Paddington"]['date'].dt.time
+        # p_day_minutes = ((p_minutes >= day_start) & (p_minutes < day_end)).sum()
 
-def p(x, prefix=None, func=lambda x: x, dont=False):
-    if prefix: print(prefix)
-    print(func(x))
-    if not dont: input("...")
+        # row = pd.DataFrame({ 'shift': [shift] * len(rng), 'First Name': [firstName] * len(rng), 'Last Name': [lastName] * len(rng), 'date': rng, 'Schedule': [schedule] * len(rng), 'Regular': [regular] * len(rng), 'Sum Regular': [ sum_regular + regular] * len(rng), 'Day.': [day] * len(rng), 'Night.': [night] * len(rng) }, index=([shift] * len(rng)))
+        row = pd.DataFrame([{ 'shift': shift, 'First Name': firstName, 'Last Name': lastName, 'date': date, 'Start Time': start, 'End Time': end, 'Schedule': schedule } for date in rng] , index=range(len(rng)))
+        df = pd.concat([df, row])
+        sum_regular += regular
+
+    return df
+
+
+day_start, day_end = time(6,00), time(22,00)
+def by_shift(shift: pd.DataFrame, ceil=False):
+    
+    minutes = shift[shift["Schedule"] != "Paddington"]['date'].dt.time
+    day_minutes   = ((minutes   >= day_start) & (minutes   < day_end)).sum()
+
+    p_minutes = shift[shift["Schedule"] == "Paddington"]['date'].dt.time
+    p_day_minutes = ((p_minutes >= day_start) & (p_minutes < day_end)).sum()
+
+    tracing.debug(f"pd.Series: {(day_minutes)} + {len(minutes) - day_minutes} = {len(minutes)}; {(p_day_minutes)} + {len(p_minutes) - p_day_minutes} = {len(p_minutes)} :: {len(shift)}")
+
+    total  = len(shift) / toHours
+    day    = day_minutes / toHours
+    night  = (len(minutes) - day_minutes) / toHours
+    pday   = p_day_minutes / toHours
+    pnight = (len(p_minutes) - p_day_minutes) / toHours
+
+    x = pd.Series({
+        "__Total__": total,
+        "Shift Day": day,
+        "Shift Night": night,  
+        "Shift P_Day": pday,  
+        "Shift P_Night": pnight
+    })
+    
+    # x = np.ceil(x  * 100) / 100 if ceil else x
     return x
 
-def floor(x):
-    return math.floor(x * 100) / 100
+def calc_day_night_hours(rows: pd.DataFrame, ceil=False) -> typing.Tuple[int, int]:
 
-def _main(args):
+        
+    x = rows.groupby(["shift"], group_keys=True).apply(lambda shift: by_shift(shift, ceil))
+    x["Sum"] = x[["Shift Day", "Shift Night", "Shift P_Day", "Shift P_Night"]].sum(axis=1)
+    y = x[["Shift Day", "Shift Night", "Shift P_Day", "Shift P_Night"]].sum()
+    tracing.debug(rows["First Name"].iloc[0] + ' ' + rows["Last Name"].iloc[0])
+    tracing.debug(x)
+    tracing.debug(y, prefix="Totals")
+    p(sum(y), prefix="Group Total: ", dont=True)
+    return y
 
-    if args.verbose:
-        print(args)
 
 
-    sheet: pd.DataFrame = pd.read_excel(cd / args.timesheet, sheet_name=args.timesheet_sheet_name, parse_dates=["Date", "Start Time", "End Time"], usecols=["First Name", "Last Name", "Date", "Start Time", "End Time", "Regular", "Schedule", "OT"])
-    pay_rates = pd.read_excel(cd / args.pay_rate_file, sheet_name=args.pay_rate_sheet_name)
-    if args.verify_pay_rates: 
-        print(pay_rates.to_string(index=True))
-        return
+def calcPerson(person, calendar: periods.PayCalendar = periods.PayCalendar(), rules: payrules.PayRules = payrules.DEFAULT):
 
+    start_times = pd.to_datetime(person["Start Time"]).dt.floor('min')
+    end_times   = pd.to_datetime(person["End Time"])
+    # minutes = pd.DataFrame(columns=['shift', 'First Name', 'Last Name', 'date', 'Schedule'])
+    # for shift, (firstName, lastName, start, end, schedule) in enumerate(zip(person["First Name"], person["Last Name"], start_times, end_times, person["Schedule"])):
+    #     rng = pd.date_range(start, end, freq=freq, tz='America/Denver')[:-1]
+    #     # regular = round(len(rng) / 60, 2)
+        
+    #     # minutes = rng.time
+    #     # day = round((np.floor(((minutes   >= day_start) & (minutes   < day_end)).sum() * 100) / 100) / 60, 2)
+    #     # night = regular - day
 
-    # Uppercase ["Last Name", "First Name"]
-    sheet["Last Name"] = sheet["Last Name"].str.upper()
-    sheet["First Name"] = sheet["First Name"].str.upper()
+    #     # p_minutes = shift[shift["Schedule"] == "Paddington"]['date'].dt.time
+    #     # p_day_minutes = ((p_minutes >= day_start) & (p_minutes < day_end)).sum()
 
+    #     # row = pd.DataFrame({ 'shift': [shift] * len(rng), 'First Name': [firstName] * len(rng), 'Last Name': [lastName] * len(rng), 'date': rng, 'Schedule': [schedule] * len(rng), 'Regular': [regular] * len(rng), 'Sum Regular': [ sum_regular + regular] * len(rng), 'Day.': [day] * len(rng), 'Night.': [night] * len(rng) }, index=([shift] * len(rng)))
+    #     row = pd.DataFrame([{ 'shift': shift, 'First Name': firstName, 'Last Name': lastName, 'date': date, 'Schedule': schedule } for date in rng] , index=range(len(rng)))
+    #     minutes = pd.concat([minutes, row])
 
-    # Sort Sheet by Date
-    sheet.sort_values(by=["Date"], inplace=True)
+        
+    # One row per worked minute: the shift number, the localised minute and the schedule code, no per-minute name strings
+    def rowFunc(start, end):
+        return pd.date_range(start, end, freq=freq, tz='America/Denver')[:-1]
 
+    ranges = [rowFunc(start, end) for start, end in zip(start_times, end_times)]
+    shift = np.repeat(np.arange(len(ranges), dtype=np.int32), [len(rng) for rng in ranges])
+    minutes = pd.DataFrame({ 'shift': shift, 'date': ranges[0].append(ranges[1:]), 'Schedule': pd.Categorical(person["Schedule"]).take(shift) })
+    tracing.debug(minutes)
 
-    def person_to_minutes(person):
-        sum_regular = 0
+    # print(minutes)
 
+    # Day window of every site as wall-clock times, and the per shift day/night keys of every site
+    clock = lambda minute: time(*divmod(int(minute), 60)) if minute < 24 * 60 else time.max
+    windows = [(clock(start), clock(end)) for start, end in zip(rules.day_start, rules.day_end)]
+    keys = [key for site in range(len(windows)) for key in (f"day{site}", f"night{site}")]
 
-        start_times = pd.to_datetime(person["Start Time"]).dt.floor('min')
-        end_times   = pd.to_datetime(person["End Time"])
-        df = pd.DataFrame(columns=['shift', 'First Name', 'Last Name', 'date', 'Start Time', 'End Time', 'Schedule'])
-        for shift, (firstName, lastName, start, end, schedule, regular) in enumerate(zip(person["First Name"], person["Last Name"], start_times, end_times, person["Schedule"], person["Regular"])):
-            rng = pd.date_range(start, end, freq=freq, tz='America/Denver')  # [:-1]
-            # regular = round(len(rng) / 60, 2)
-            
-            # minutes = rng.time
-            # day = round((np.floor(((minutes   >= day_start) & (minutes   < day_end)).sum() * 100) / 100) / 60, 2)
-            # night = regular - day
+    def calcShift(shift_minutes: pd.DataFrame):
+        lastItem = shift_minutes.iloc[-1]
 
-            # p_minutes = shift[shift["Schedule"] == "Paddington"]['date'].dt.time
-            # p_day_minutes = ((p_minutes >= day_start) & (p_minutes < day_end)).sum()
+        lastItem['minutes'] = len(shift_minutes)
+        lastItem['regular'] = round(len(shift_minutes) / 60, 2)
+        # lastItem['regular'] = np.ceil((len(shift_minutes) / 60) * 100) / 100
 
-            # row = pd.DataFrame({ 'shift': [shift] * len(rng), 'First Name': [firstName] * len(rng), 'Last Name': [lastName] * len(rng), 'date': rng, 'Schedule': [schedule] * len(rng), 'Regular': [regular] * len(rng), 'Sum Regular': [ sum_regular + regular] * len(rng), 'Day.': [day] * len(rng), 'Night.': [night] * len(rng) }, index=([shift] * len(rng)))
-            row = pd.DataFrame([{ 'shift': shift, 'First Name': firstName, 'Last Name': lastName, 'date': date, 'Start Time': start, 'End Time': end, 'Schedule': schedule } for date in rng] , index=range(len(rng)))
-            df = pd.concat([df, row])
-            sum_regular += regular
 
-        return df
+        site = rules.site(lastItem['Schedule'])
+        day_start, day_end = windows[site]
 
+        minutes = shift_minutes['date'].dt.time
+        # day = round((np.floor(((minutes >= day_start) & (minutes < day_end)).sum() * 100) / 100) / 60, 2)
+        _hours = math.ceil((len(minutes)/60)*100)/100
+        _day_minutes = ((minutes >= day_start) & (minutes < day_end)).sum()
+        _day_hours = round(_day_minutes/60, 2)
+        _night_hours = _hours - _day_hours
 
-    day_start, day_end = time(6,00), time(22,00)
-    def by_shift(shift: pd.DataFrame, ceil=False):
-        
-        minutes = shift[shift["Schedule"] != "Paddington"]['date'].dt.time
-        day_minutes   = ((minutes   >= day_start) & (minutes   < day_end)).sum()
-
-        p_minutes = shift[shift["Schedule"] == "Paddington"]['date'].dt.time
-        p_day_minutes = ((p_minutes >= day_start) & (p_minutes < day_end)).sum()
-
-        print(f"pd.Series: {(day_minutes)} + {len(minutes) - day_minutes} = {len(minutes)}; {(p_day_minutes)} + {len(p_minutes) - p_day_minutes} = {len(p_minutes)} :: {len(shift)}")
-
-        total  = len(shift) / toHours
-        day    = day_minutes / toHours
-        night  = (len(minutes) - day_minutes) / toHours
-        pday   = p_day_minutes / toHours
-        pnight = (len(p_minutes) - p_day_minutes) / toHours
-
-        x = pd.Series({
-            "__Total__": total,
-            "Shift Day": day,
-            "Shift Night": night,  
-            "Shift P_Day": pday,  
-            "Shift P_Night": pnight
-        })
+        day = _day_hours
+        # night = _night_hours
+
+        night = lastItem['regular'] - day
+
+        for i in range(len(windows)):
+            lastItem[f"day{i}"], lastItem[f"night{i}"] = (day, night) if i == site else (0, 0)
+
+
+        # minutes = shift_minutes['date'].dt.time
+        # night1 = round((np.floor(((minutes < day_start)).sum() * 100) / 100) / 60, 2) 
+        # day = round((np.floor(((minutes >= day_start) & (minutes < day_end)).sum() * 100) / 100) / 60, 2)
+        # night2 = lastItem['regular'] - (night1 + day)
+
+        # hours = (day, night1, night2, 0, 0, 0) if lastItem['Schedule'] != 'Paddington' else (0, 0, 0, day, night1, night2)
+        # lastItem['day'], lastItem['night1'], lastItem['night2'], lastItem['pday'], lastItem['pnight1'], lastItem['pnight2'] = hours
+
+        return lastItem
+
+    def calcWeek(week: pd.DataFrame):
         
-        # x = np.ceil(x  * 100) / 100 if ceil else x
+        # print(f"+++++  Week  {week['Week'].iloc[0].item()}  +++++")
+
+        hasOverTime = len(week['date']) > forty
+        if hasOverTime:
+
+            isOT = week['date'] >= week['date'].iloc[forty]
+            tracing.debug("=====  40 Hours  =====")
+            week_group = week[~isOT]
+            shifts =  week_group.groupby('shift').apply(calcShift)[keys].sum().round(2)
+            # shifts['CumSum regular'] = shifts['regular'].cumsum()
+            # print(shifts)
+            # assert day + night + pday + pnight == 40, f"Sum of Day and Night are not 40: {day + night + pday + pnight}"
+
+            tracing.debug("=====  OT Hours  =====")
+            # isOT = week['date'] >= week['date'].iloc[forty - 1]
+            week_group_ot = week[ isOT]
+            shifts_ot =  week_group_ot.groupby('shift').apply(calcShift)[keys].sum().round(2)
+            # shifts_ot['CumSum regular'] = shifts_ot['regular'].cumsum()
+            # print(shifts_ot)
+
+            # return pd.concat([shifts, shifts_ot]).apply(calcOT, axis=1)
+            
+        else:
+
+            tracing.debug("===== < 40 Hours =====")
+            week_group = week
+            shifts =  week_group.groupby('shift').apply(calcShift)[keys].sum().round(2)
+            # shifts['CumSum regular'] = shifts['regular'].cumsum()
+            # print(shifts)
+            shifts_ot = pd.Series(0, index=keys)
+
+            # return shifts.apply(calcOT, axis=1)
+
+        regular = sum(shifts[keys])
+        assert round(regular, 1) <= 40, "Sum of Day and Night are not less than 40: "+str(regular) 
+
+        x = pd.Series({ rules.column(site, bucket): hours[f"{kind}{site}"] for site in range(len(windows)) for bucket, hours, kind in zip(payrules.BUCKETS, [shifts, shifts, shifts_ot, shifts_ot], ["day", "night", "day", "night"]) })
+        tracing.debug(x)
         return x
-    
-    def calc_day_night_hours(rows: pd.DataFrame, ceil=False) -> typing.Tuple[int, int]:
 
-            
-        x = rows.groupby(["shift"], group_keys=True).apply(lambda shift: by_shift(shift, ceil))
-        x["Sum"] = x[["Shift Day", "Shift Night", "Shift P_Day", "Shift P_Night"]].sum(axis=1)
-        y = x[["Shift Day", "Shift Night", "Shift P_Day", "Shift P_Night"]].sum()
-        print(rows["First Name"].iloc[0] + ' ' + rows["Last Name"].iloc[0])
-        print(x)
-        print("Totals")
-        print(y)
-        p(sum(y), prefix="Group Total: ", dont=True)
-        return y
-
-
-
-    def calcPerson(person):
-
-        start_times = pd.to_datetime(person["Start Time"]).dt.floor('min')
-        end_times   = pd.to_datetime(person["End Time"])
-        # minutes = pd.DataFrame(columns=['shift', 'First Name', 'Last Name', 'date', 'Schedule'])
-        # for shift, (firstName, lastName, start, end, schedule) in enumerate(zip(person["First Name"], person["Last Name"], start_times, end_times, person["Schedule"])):
-        #     rng = pd.date_range(start, end, freq=freq, tz='America/Denver')[:-1]
-        #     # regular = round(len(rng) / 60, 2)
-            
-        #     # minutes = rng.time
-        #     # day = round((np.floor(((minutes   >= day_start) & (minutes   < day_end)).sum() * 100) / 100) / 60, 2)
-        #     # night = regular - day
 
-        #     # p_minutes = shift[shift["Schedule"] == "Paddington"]['date'].dt.time
-        #     # p_day_minutes = ((p_minutes >= day_start) & (p_minutes < day_end)).sum()
+    minutes['Week'] = calendar.week(minutes['date'].dt.tz_localize(None).to_numpy().astype('datetime64[m]').astype(np.int64))[0]
+    return minutes.groupby('Week').apply(calcWeek)
 
-        #     # row = pd.DataFrame({ 'shift': [shift] * len(rng), 'First Name': [firstName] * len(rng), 'Last Name': [lastName] * len(rng), 'date': rng, 'Schedule': [schedule] * len(rng), 'Regular': [regular] * len(rng), 'Sum Regular': [ sum_regular + regular] * len(rng), 'Day.': [day] * len(rng), 'Night.': [night] * len(rng) }, index=([shift] * len(rng)))
-        #     row = pd.DataFrame([{ 'shift': shift, 'First Name': firstName, 'Last Name': lastName, 'date': date, 'Schedule': schedule } for date in rng] , index=range(len(rng)))
-        #     minutes = pd.concat([minutes, row])
 
-            
-        def rowFunc(row):
-            shift, (firstName, lastName, start, end, schedule) = row
-            rng = pd.date_range(start, end, freq=freq, tz='America/Denver')[:-1]
-            size = len(rng)
-            return pd.DataFrame({ 'shift': [shift]*size, 'First Name': [firstName]*size, 'Last Name': [lastName]*size, 'date': rng, 'Schedule': [schedule]*size }, index=range(size))
+# ========================================================================
+# =================        Sharded by Employee         =====================
+# ========================================================================
 
-        minutes = pd.concat([rowFunc(row) for row in enumerate(zip(person["First Name"], person["Last Name"], start_times, end_times, person["Schedule"]))])
-        print(minutes)
+def calc_hours(sheet: pd.DataFrame, engine: str = "interval", dst_policy: str = "raise", calendar: periods.PayCalendar = periods.PayCalendar(), rules: payrules.PayRules = payrules.DEFAULT) -> pd.DataFrame:
+    """ Day/Night/OT hours indexed by (Last Name, First Name, Week), Week is the pay calendar workweek """
+    if engine == "minute":
+        return sheet.groupby(["Last Name", "First Name"], group_keys=True).apply(tracing.timed("employee", calcPerson, label=lambda person: " ".join(person.name)), calendar=calendar, rules=rules)
+    return intervals.calc_shifts(shifts.ShiftTable.from_sheet(sheet, dst_policy), calendar, rules)
 
-        # print(minutes)
 
-        def calcShift(shift_minutes: pd.DataFrame):
-            lastItem = shift_minutes.iloc[-1]
+def shard_by_employee(sheet: pd.DataFrame, shards: int) -> typing.List[pd.DataFrame]:
+    """ Split the sheet into whole employees, in employee order, with about the same number of rows per shard """
+    person = sheet.groupby(["Last Name", "First Name"], sort=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    sheet, person = sheet[person >= 0], person[person >= 0]
 
-            lastItem['minutes'] = len(shift_minutes)
-            lastItem['regular'] = round(len(shift_minutes) / 60, 2)
-            # lastItem['regular'] = np.ceil((len(shift_minutes) / 60) * 100) / 100
+    sizes = np.bincount(person)
+    shard_of = ((np.cumsum(sizes) - sizes) * shards) // max(len(person), 1)
+    row_shard = shard_of[person]
+    return [sheet[row_shard == i] for i in np.unique(row_shard)]
 
 
-            minutes = shift_minutes['date'].dt.time
-            # day = round((np.floor(((minutes >= day_start) & (minutes < day_end)).sum() * 100) / 100) / 60, 2)
-            _hours = math.ceil((len(minutes)/60)*100)/100
-            _day_minutes = ((minutes >= day_start) & (minutes < day_end)).sum()
-            _day_hours = round(_day_minutes/60, 2)
-            _night_hours = _hours - _day_hours
+def calc_hours_parallel(sheet: pd.DataFrame, engine: str = "interval", workers: int = 1, dst_policy: str = "raise", calendar: periods.PayCalendar = periods.PayCalendar(), rules: payrules.PayRules = payrules.DEFAULT) -> pd.DataFrame:
+    """ calc_hours over a process pool, every employee is independent so the shards simply concatenate """
+    shards = shard_by_employee(sheet, workers) if workers > 1 else []
+    if len(shards) <= 1:
+        return calc_hours(sheet, engine, dst_policy, calendar, rules)
 
-            day = _day_hours
-            # night = _night_hours
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        return pd.concat(map(tracing.merge, pool.map(tracing.remote, itertools.repeat(calc_hours), itertools.repeat(tracing.ENABLED), shards, itertools.repeat(engine), itertools.repeat(dst_policy), itertools.repeat(calendar), itertools.repeat(rules))))
 
-            night = lastItem['regular'] - day
 
-            hours = (day, night, 0, 0) if lastItem['Schedule'] != 'Paddington' else (0, 0, day, night)
-            lastItem['day'], lastItem['night'], lastItem['pday'], lastItem['pnight'] = hours
+# ========================================================================
+# =================       Incremental Recompute        =====================
+# ========================================================================
 
+def fingerprints(sheet: pd.DataFrame, rates: pd.DataFrame, engine: str, dst_policy: str = "raise", calendar: periods.PayCalendar = periods.PayCalendar(), rules: payrules.PayRules = payrules.DEFAULT) -> pd.Series:
+    """ Hash of every employee's timesheet rows (in order) and pay rates, indexed by (Last Name, First Name) """
+    rows = pd.util.hash_pandas_object(sheet[["Date", "Start Time", "End Time", "Schedule"]], index=False).to_numpy()
 
-            # minutes = shift_minutes['date'].dt.time
-            # night1 = round((np.floor(((minutes < day_start)).sum() * 100) / 100) / 60, 2) 
-            # day = round((np.floor(((minutes >= day_start) & (minutes < day_end)).sum() * 100) / 100) / 60, 2)
-            # night2 = lastItem['regular'] - (night1 + day)
+    prints = {}
+    for name, positions in sheet.groupby(["Last Name", "First Name"], sort=True).indices.items():
+        rate = rates.loc[name].tolist() if name in rates.index else None
+        prints[name] = hashlib.sha256(rows[positions].tobytes() + repr((engine, dst_policy, calendar, rules, rate)).encode()).hexdigest()
 
-            # hours = (day, night1, night2, 0, 0, 0) if lastItem['Schedule'] != 'Paddington' else (0, 0, 0, day, night1, night2)
-            # lastItem['day'], lastItem['night1'], lastItem['night2'], lastItem['pday'], lastItem['pnight1'], lastItem['pnight2'] = hours
+    return pd.Series(prints, dtype=object).rename_axis(["Last Name", "First Name"])
 
-            return lastItem
 
-        def calcWeek(week: pd.DataFrame):
-            
-            # print(f"+++++  Week  {week['Week'].iloc[0].item()}  +++++")
+def incremental_state(args, timesheet: pathlib.Path) -> pathlib.Path:
+    return cd / args.cache_dir / "incremental" / (hashlib.sha256(str(timesheet.resolve()).encode()).hexdigest()[:16] + ".npz")
 
-            hasOverTime = len(week['date']) > forty
-            if hasOverTime:
 
-                isOT = week['date'] >= week['date'].iloc[forty]
-                print("=====  40 Hours  =====")
-                week_group = week[~isOT]
-                shifts =  week_group.groupby('shift').apply(calcShift)[["day", "night", "pday", "pnight"]].sum().round(2)
-                # shifts['CumSum regular'] = shifts['regular'].cumsum()
-                # print(shifts)
-                day, night, pday, pnight = shifts["day"], shifts["night"], shifts["pday"], shifts["pnight"]
-                # assert day + night + pday + pnight == 40, f"Sum of Day and Night are not 40: {day + night + pday + pnight}"
+def calc_hours_incremental(sheet: pd.DataFrame, rates: pd.DataFrame, state: pathlib.Path, engine: str = "interval", workers: int = 1, dst_policy: str = "raise", calendar: periods.PayCalendar = periods.PayCalendar(), rules: payrules.PayRules = payrules.DEFAULT) -> pd.DataFrame:
+    """ calc_hours_parallel for the employees whose fingerprint changed, the saved weeks for everyone else """
+    prints = fingerprints(sheet, rates, engine, dst_policy, calendar, rules)
 
-                print("=====  OT Hours  =====")
-                # isOT = week['date'] >= week['date'].iloc[forty - 1]
-                week_group_ot = week[ isOT]
-                shifts_ot =  week_group_ot.groupby('shift').apply(calcShift)[["day", "night", "pday", "pnight"]].sum().round(2)
-                # shifts_ot['CumSum regular'] = shifts_ot['regular'].cumsum()
-                # print(shifts_ot)
-                dayot, nightot, pdayot, pnightot = shifts_ot["day"], shifts_ot["night"], shifts_ot["pday"], shifts_ot["pnight"]
+    try:
+        previous = loader.load_frame(state).set_index(["Last Name", "First Name", "Week"])
+    except (OSError, ValueError, KeyError):
+        previous = None
 
-                # return pd.concat([shifts, shifts_ot]).apply(calcOT, axis=1)
-                
-            else:
+    if previous is not None:
+        names = previous.index.droplevel("Week")
+        unchanged = previous["Fingerprint"].to_numpy() == prints.reindex(names).to_numpy()
+        reused = previous[unchanged].drop(columns="Fingerprint")
+    else:
+        reused = pd.DataFrame(columns=rules.columns, index=pd.MultiIndex.from_tuples([], names=["Last Name", "First Name", "Week"]))
 
-                print("===== < 40 Hours =====")
-                week_group = week
-                shifts =  week_group.groupby('shift').apply(calcShift)[["day", "night", "pday", "pnight"]].sum().round(2)
-                # shifts['CumSum regular'] = shifts['regular'].cumsum()
-                # print(shifts)
-                day, night, pday, pnight = shifts["day"], shifts["night"], shifts["pday"], shifts["pnight"]
-                dayot, nightot, pdayot, pnightot = (0, 0, 0, 0)
+    changed = prints.index.difference(reused.index.droplevel("Week").unique())
+    print(f"Incremental: reusing {len(prints) - len(changed)} of {len(prints)} employees, recomputing {len(changed)}")
 
-                # return shifts.apply(calcOT, axis=1)
+    calculated = reused
+    if len(changed):
+        rows = pd.MultiIndex.from_frame(sheet[["Last Name", "First Name"]]).isin(changed)
+        calculated = pd.concat([reused, calc_hours_parallel(sheet[rows], engine, workers, dst_policy, calendar, rules)]).sort_index()
+    calculated = calculated.astype(float)
 
-            assert round(day + night + pday + pnight, 1) <= 40, "Sum of Day and Night are not less than 40: "+str(day + night + pday + pnight) 
+    state.parent.mkdir(parents=True, exist_ok=True)
+    saved = calculated.copy()
+    saved["Fingerprint"] = prints.reindex(saved.index.droplevel("Week")).to_numpy()
+    loader.save_frame(saved.reset_index(), state)
+    return calculated
 
-            x = pd.Series({ "Day": day, "Night": night, "Day_OT": dayot, "Night_OT": nightot, "Paddington Day": pday, "Paddington Night": pnight, "Paddington Day_OT": pdayot, "Paddington Night_OT": pnightot })
-            print(x)
-            return x
 
+def cache_dir(args) -> typing.Optional[pathlib.Path]:
+    return None if args.no_cache else cd / args.cache_dir
 
-        minutes['Week'] = minutes['date'].dt.strftime("%U").astype(int)
-        return minutes.groupby('Week').apply(calcWeek)
 
-    freq, toHours, forty = "min", (60), (40 * 60)
+TIMESHEET_COLUMNS = ["First Name", "Last Name", "Date", "Start Time", "End Time", "Regular", "Schedule", "OT"]
+TIMESHEET_DATES = ["Date", "Start Time", "End Time"]
+TIMESHEET_OPTIONAL = ["Employee ID"]
+
+
+def read_timesheet(path: typing.Union[pathlib.Path, typing.BinaryIO], sheet_name: str = "Entries", cache: typing.Optional[pathlib.Path] = None) -> pd.DataFrame:
+    with tracing.span("read", file=str(path), sheet=sheet_name) as s:
+        sheet: pd.DataFrame = loader.read_sheet(path, sheet_name, parse_dates=TIMESHEET_DATES, usecols=TIMESHEET_COLUMNS, optional=TIMESHEET_OPTIONAL, cache_dir=cache)
+        s.set(rows=len(sheet))
+    return prepare_timesheet(sheet)
+
+
+def prepare_timesheet(sheet: pd.DataFrame) -> pd.DataFrame:
+    """ Upper case names, rows sorted by Date (stable, rows of a day keep their sheet order) """
+    # Uppercase ["Last Name", "First Name"]
+    sheet["Last Name"] = sheet["Last Name"].str.upper()
+    sheet["First Name"] = sheet["First Name"].str.upper()
+
+
+    # Sort Sheet by Date
+    sheet.sort_values(by=["Date"], inplace=True, kind="stable")
+    return sheet
+
+
+def read_pay_rates(path: pathlib.Path, sheet_name: str = "Pay Rate", cache: typing.Optional[pathlib.Path] = None) -> pd.DataFrame:
+    with tracing.span("read", file=str(path), sheet=sheet_name):
+        return loader.read_sheet(path, sheet_name, cache_dir=cache)
+
+
+def pay_calendar(args) -> periods.PayCalendar:
+    return periods.PayCalendar(args.week_start, args.period_anchor, args.period_weeks)
+
+
+def pay_rules(args) -> payrules.PayRules:
+    return payrules.PayRules.load(None if args.pay_rules is None else cd / args.pay_rules)
+
+
+def employee_registry(pay_rates: pd.DataFrame, rules: payrules.PayRules = payrules.DEFAULT) -> registry.Registry:
+    """ The rules' rate columns (Day/Night Rate) of every pay rate employee, by name, ID and alias """
+    return registry.Registry(pay_rates, rules.rate_columns)
+
+
+def report_employees(report: typing.Dict[str, typing.List[str]], strict: bool = False):
+    """ Print the unmatched / ambiguous names of Registry.resolve, ValueError with `strict` when there are any """
+    for problem, names in report.items():
+        if names:
+            print(f"{problem.capitalize()} employees ({len(names)}): " + "; ".join(names))
+    if strict and any(report.values()):
+        raise ValueError(f"{len(report['unmatched'])} unmatched and {len(report['ambiguous'])} ambiguous employees, see above")
+
+
+def match_employees(sheet: pd.DataFrame, employees: registry.Registry, strict: bool = False) -> pd.DataFrame:
+    """ Pay rates indexed by the timesheet's (Last Name, First Name), reporting names without exactly one match """
+    rates, report = employees.resolve(sheet)
+    report_employees(report, strict)
+    return rates
+
+
+def calc_payroll(sheet: pd.DataFrame, pay_rates: pd.DataFrame, args, state: typing.Optional[pathlib.Path] = None, employees: typing.Optional[registry.Registry] = None) -> typing.Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """ Returns (g, d, hours_output, pay_output), `state` turns on incremental recomputation
+
+    `employees` is employee_registry(pay_rates), pass it in to reuse it across calls.
+    """
+    rules = pay_rules(args)
+    if employees is None:
+        employees = employee_registry(pay_rates, rules)
+    rates = match_employees(sheet, employees, args.strict_names)
+    calendar = pay_calendar(args)
 
     st = datetime.now()
-    print("Start Time: ", st)
+    tracing.debug("Start Time: ", st)
+    hours_span = tracing.start("hours", rows=len(sheet), engine=args.engine, workers=args.workers)
     # calculated = sheet.groupby(["Last Name", "First Name"]).filter(lambda x: x["First Name"].iloc[0] in ["CORRINA", "JANELL", "EDITH", "RYLEE", "SUMMER", "FANNY"]).groupby(["Last Name", "First Name"]).apply(calcPerson)
     # calculated = sheet.groupby(["Last Name", "First Name"]).filter(lambda x: x["First Name"].iloc[0] in ["CORRINA", "JANELL"]).groupby(["Last Name", "First Name"]).apply(calcPerson)
-    calculated = sheet.groupby(["Last Name", "First Name"], group_keys=True).apply(calcPerson)
-    print("Duration: ", datetime.now() - st)
-
+    if state is not None:
+        calculated = calc_hours_incremental(sheet, rates, state, args.engine, args.workers, args.dst_policy, calendar, rules)
+    else:
+        calculated = calc_hours_parallel(sheet, args.engine, args.workers, args.dst_policy, calendar, rules)
+    hours_span.stop()
+    tracing.debug("Duration: ", datetime.now() - st)
+
+    return payroll_tables(calculated, rates, timesheet_hours(sheet), args, rules)
+
+
+def timesheet_hours(sheet: pd.DataFrame) -> pd.DataFrame:
+    """ The Regular and OT hours the timesheet itself reports, per employee """
+    return sheet.groupby(["Last Name", "First Name"], group_keys=True)[["Regular", "OT"]].sum(numeric_only=True)
+
+
+def calc_payroll_chunked(path: pathlib.Path, pay_rates: pd.DataFrame, args, employees: typing.Optional[registry.Registry] = None) -> typing.Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """ calc_payroll of a timesheet file read args.chunk_rows rows at a time, only the per-employee-week hours are kept
+
+    A partition holds whole employees, so its names are matched before its hours are calculated and --strict-names stops
+    at the first partition with a name problem.
+    """
+    rules = pay_rules(args)
+    if employees is None:
+        employees = employee_registry(pay_rates, rules)
+    calendar = pay_calendar(args)
+
+    calculated, sheet_hours, rates, reports = [], [], [], []
+    for sheet in chunks.partitions(path, args.timesheet_sheet_name, args.chunk_rows, TIMESHEET_COLUMNS, TIMESHEET_DATES, TIMESHEET_OPTIONAL, cache_dir(args)):
+        with tracing.span("chunk", rows=len(sheet)):
+            sheet = prepare_timesheet(sheet)
+            partition_rates, report = employees.resolve(sheet)
+            if args.strict_names and any(report.values()):
+                report_employees(report, strict=True)
+            rates.append(partition_rates)
+            reports.append(report)
+            calculated.append(calc_hours_parallel(sheet, args.engine, args.workers, args.dst_policy, calendar, rules))
+            sheet_hours.append(timesheet_hours(sheet))
+
+    if not calculated:
+        raise ValueError(f"No timesheet rows in {path.name}")
+
+    # One report for the whole sheet, in employee order like match_employees
+    rates = pd.concat(rates).sort_index()
+    names = rates.index.to_frame(index=False)
+    order = {name: i for i, name in enumerate(registry.name_keys(names["Last Name"], names["First Name"]))}
+    report_employees({problem: sorted((name for report in reports for name in report[problem]), key=order.get) for problem in reports[0]})
+    return payroll_tables(pd.concat(calculated), rates, pd.concat(sheet_hours).sort_index(), args, rules)
+
+
+def payroll_tables(calculated: pd.DataFrame, rates: pd.DataFrame, sheet_hours: pd.DataFrame, args, rules: payrules.PayRules = payrules.DEFAULT) -> typing.Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """ (g, d, hours_output, pay_output) from the calculated hours, the matched pay rates and timesheet_hours """
 
     # ========================================================================
     # =================         Day And Night OT         =====================
     # ========================================================================
-    eight_columns = ["Day", "Night", "Day_OT", "Night_OT", "Paddington Day", "Paddington Night", "Paddington Day_OT", "Paddington Night_OT"]
-
+    pay_span = tracing.start("pay", weeks=len(calculated))
 
     g = calculated.groupby(["Last Name", "First Name", "Week"]).sum()
 
-    non_ot = g[["Day", "Paddington Day", "Night", "Paddington Night"]].sum(axis=1, numeric_only=True)
+    non_ot = g[rules.bucket_columns("Day") + rules.bucket_columns("Night")].sum(axis=1, numeric_only=True)
     weeks = list(set(non_ot.index.get_level_values('Week')))
     weeks.sort()
     # week1_non_ot = list(non_ot[non_ot.index.get_level_values('Week') == weeks[0]].values.copy())
     # week2_non_ot = list(non_ot[non_ot.index.get_level_values('Week') == weeks[1]].values.copy())
     # print({"non_ot": non_ot, "week1_non_ot": week1_non_ot, "week2_non_ot": week2_non_ot})
 
-    g["Total OT"] = g["Day_OT"] + g["Night_OT"] + g["Paddington Day_OT"] + g["Paddington Night_OT"]
-    g["Total Hours"] = g[eight_columns].sum(axis=1)
+    g["Total OT"] = sum(g[column] for column in rules.ot_columns)
+    g["Total Hours"] = g[rules.columns].sum(axis=1)
 
-    # Weighted Overtime
-    g[["Day Rate", "Night Rate"]] = pay_rates.groupby(["LAST", "FIRST"]).max()[["Day Rate", "Night Rate"]]
+    # Weighted Overtime: (rate + differential) * multiplier * hours for every column at once
+    g[rules.rate_columns] = rates
+    pay = rules.pay(g, g)
+    g[pay.columns] = pay
 
-    g["Day Pay"]      =  g["Day Rate"]   *        g["Day"]
-    g["Day_OT Pay"]   = (g["Day Rate"]   * 1.5) * g["Day_OT"]
-    g["Night Pay"]    =  g["Night Rate"] *        g["Night"]
-    g["Night_OT Pay"] = (g["Night Rate"] * 1.5) * g["Night_OT"]
-    g["Paddington Day Pay"]      =  (g["Day Rate"]   + 2) *        g["Paddington Day"]
-    g["Paddington Day_OT Pay"]   = ((g["Day Rate"]   + 2) * 1.5) * g["Paddington Day_OT"]
-    g["Paddington Night Pay"]    =  (g["Night Rate"] + 2) *        g["Paddington Night"]
-    g["Paddington Night_OT Pay"] = ((g["Night Rate"] + 2) * 1.5) * g["Paddington Night_OT"]
-
-    g["Pay"]    = g["Day Pay"]    + g["Night Pay"]    + g["Paddington Day Pay"]    + g["Paddington Night Pay"]
-    g["Pay_OT"] = g["Day_OT Pay"] + g["Night_OT Pay"] + g["Paddington Day_OT Pay"] + g["Paddington Night_OT Pay"]
+    g["Pay"]    = sum(g[f"{column} Pay"] for column in rules.regular_columns)
+    g["Pay_OT"] = sum(g[f"{column} Pay"] for column in rules.ot_columns)
 
 
     """ OUTPUT: Total Day, Total Night, Total Weighted OT, Paddington Bonus, TOTAL PAY (PAY1+PAY2+WOT1+WOT2+P1+P2) """
     d = g.groupby(["Last Name", "First Name"]).sum()
     d["Total Pay"] = d[["Pay", "Pay_OT"]].sum(axis=1)
+    pay_span.stop()
    
 
-    pay_output = d[["Day Pay", "Paddington Day Pay", "Day_OT Pay", "Paddington Day_OT Pay", "Night Pay", "Paddington Night Pay", "Night_OT Pay", "Paddington Night_OT Pay", "Pay", "Pay_OT", "Total Pay"]]
-    hours_output = d[["Day", "Paddington Day", "Day_OT", "Paddington Day_OT", "Night", "Paddington Night", "Night_OT", "Paddington Night_OT", "Total OT", "Total Hours"]]
+    # Columns in the order Kelly McMullin desires
+    pay_output = d[[f"{column} Pay" for column in rules.output_columns()] + ["Pay", "Pay_OT", "Total Pay"]]
+    hours_output = d[rules.output_columns() + ["Total OT", "Total Hours"]]
     if args.verify_output:
         print(pay_output.to_string(index=True))
         print(hours_output.to_string(index=True))
@@ -307,9 +491,8 @@ def _main(args):
 
 
     # Calc Diff
-    sheet_hours = sheet.groupby(["Last Name", "First Name"], group_keys=True)[["Regular", "OT"]].sum(numeric_only=True)
     sheet_hours["Total"] = sheet_hours.sum(axis=1, numeric_only=True)
-    d["Total Regular"] = d[["Day", "Paddington Day", "Night", "Paddington Night"]].sum(axis=1, numeric_only=True)
+    d["Total Regular"] = d[rules.bucket_columns("Day") + rules.bucket_columns("Night")].sum(axis=1, numeric_only=True)
 
     hours_output["Diff Regular"] = (d["Total Regular"] - sheet_hours["Regular"]).round(2)
     hours_output["Diff OT"]      = (d["Total OT"]      - sheet_hours["OT"]).round(2)
@@ -335,102 +518,153 @@ def _main(args):
     # hours_output["2 Diff OT"]      = (gg["Total OT"]      - sheet_hours["OT"]).round(2)
     # hours_output["2 Diff Total"]   = (gg["Total Hours"]   - sheet_hours["Total"]).round(2)
 
-    
-    # Reorder the Columns to the Output Kelly McMullin desires
-    pay_output = pay_output[["Day Pay", "Night Pay", "Paddington Night Pay", "Night_OT Pay", "Paddington Night_OT Pay", "Day_OT Pay", "Paddington Day_OT Pay", "Paddington Day Pay", "Pay", "Pay_OT", "Total Pay"]]
-    hours_output = hours_output[["Day", "Night", "Paddington Night", "Night_OT", "Paddington Night_OT", "Day_OT", "Paddington Day_OT", "Paddington Day", "Total OT", "Total Hours", "Diff Regular", "Diff OT", "Diff Total"]]
-
 
-    def toSheet(writer: pd.ExcelWriter, data: pd.DataFrame, sheet_name: str):
 
-        workbook = writer.book
+    return g, d, hours_output, pay_output
 
-        index_format = workbook.add_format({'right': 1, 'right_color': '#4F81BD', 'left': 1, 'left_color': '#4F81BD', 'bottom': 1, 'bottom_color': '#4F81BD'})
-        column_format = workbook.add_format({})
-        green_format = workbook.add_format({'bg_color': '#C6EFCE'})
-        red_format = workbook.add_format({'bg_color': '#FFC7CE'})
 
-        data = data.reset_index()
+def toSheet(workbook: xlsxwriter.Workbook, data: pd.DataFrame, sheet_name: str):
 
-        data.to_excel(writer, sheet_name=sheet_name, na_rep='NaN', startrow=1, header=False, index=False)
-        
-        # Set Column Width
-        for col_idx in range(len(data.columns)):
-            column_width = max(data[data.columns[col_idx]].astype(str).map(len).max(), len(data.columns[col_idx]))  # finds largest cell width in column
-            writer.sheets[sheet_name].set_column(col_idx, col_idx, column_width + 2, column_format)
+    worksheet = workbook.add_worksheet(sheet_name)
 
-        # Set Index Border
-        for row_idx, row in data.iterrows():
-            writer.sheets[sheet_name].write(row_idx + 1, 0, row[0], index_format)
-            writer.sheets[sheet_name].write(row_idx + 1, 1, row[1], index_format)
+    index_format = workbook.add_format({'right': 1, 'right_color': '#4F81BD', 'left': 1, 'left_color': '#4F81BD', 'bottom': 1, 'bottom_color': '#4F81BD'})
+    column_format = workbook.add_format({})
+    green_format = workbook.add_format({'bg_color': '#C6EFCE'})
+    red_format = workbook.add_format({'bg_color': '#FFC7CE'})
 
-        # Set Diff Cell Red/Green
-        for row_idx, row in data.iterrows():
-            for col_idx, col in enumerate(row):
-                # print({'row_idx': row_idx, 'col_idx': col_idx, 'col': col, 'column_name': data.columns[col_idx]})
-                
-                if not isinstance(col, (int, float)):
-                    continue
+    data = data.reset_index()
 
-                column_name = data.columns[col_idx]
-                if "Diff" not in column_name:
-                    continue
+    # Get the dimensions of the dataframe.
+    (max_row, max_col) = data.shape
 
-                _format = green_format if col > 0 else red_format if col < 0 else None
-                writer.sheets[sheet_name].write(row_idx + 1, col_idx, col, _format)
+    # Set Column Width, largest cell or header width per column in one pass
+    cell_widths = np.char.str_len(data.astype(str).to_numpy(dtype=str)).max(axis=0, initial=0)
+    header_widths = np.char.str_len(np.array(data.columns, dtype=str))
+    for col_idx, column_width in enumerate(np.maximum(cell_widths, header_widths)):
+        worksheet.set_column(col_idx, col_idx, int(column_width) + 2, column_format)
 
-        # Get the dimensions of the dataframe.
-        (max_row, max_col) = data.shape
+    # Write the rows in order, the name columns with the index border
+    values = data.astype(object).where(data.notna(), 'NaN').to_numpy()
+    for row_idx, row in enumerate(values, start=1):
+        worksheet.write_row(row_idx, 0, row[:2], index_format)
+        worksheet.write_row(row_idx, 2, row[2:])
 
-        # Create a list of column headers, to use in add_table().
-        column_settings = [{'header': column} for column in data.columns]
+    # Set Diff Cell Red/Green
+    for col_idx, column_name in enumerate(data.columns):
+        if "Diff" in column_name and max_row:
+            worksheet.conditional_format(1, col_idx, max_row, col_idx, {'type': 'cell', 'criteria': '>', 'value': 0, 'format': green_format})
+            worksheet.conditional_format(1, col_idx, max_row, col_idx, {'type': 'cell', 'criteria': '<', 'value': 0, 'format': red_format})
 
-        # Add the Excel table structure. Pandas will add the data.
-        writer.sheets[sheet_name].add_table(0, 0, max_row, max_col - 1, {'columns': column_settings, 'autofilter': False, 'banded_columns': False, 'style': 'Table Style Medium 9'})
+    # Create a list of column headers, to use in add_table().
+    column_settings = [{'header': column} for column in data.columns]
 
-        return workbook, writer.sheets[sheet_name]
+    # Add the Excel table structure over the rows written above.
+    worksheet.add_table(0, 0, max_row, max_col - 1, {'columns': column_settings, 'autofilter': False, 'banded_columns': False, 'style': 'Table Style Medium 9'})
 
+    return workbook, worksheet
 
-    # Save File
-    output_filename = args.timesheet.replace(".xlsx", f"{args.output_tag}.xlsx")
-    writer = pd.ExcelWriter(cd / output_filename)
-    
-    # Hours Output
-    toSheet(writer=writer, data=hours_output, sheet_name=args.output_sheet_name + ' - Hours')
 
-    # Pay Output
-    toSheet(writer=writer, data=pay_output, sheet_name=args.output_sheet_name + ' - Pay')
+def cross_check(sheet: pd.DataFrame, g: pd.DataFrame, args):
+    """ Stop before anything is written when the minute reference disagrees with g (--cross-check) """
+    import crosscheck
+    if crosscheck.cross_check(sheet, g, args):
+        raise ValueError("Cross-check against the minute engine found differences, see above")
 
-    writer.close()
 
+def output_path(timesheet: pathlib.Path, output_tag: str) -> pathlib.Path:
+    return timesheet.with_name(timesheet.name.replace(".xlsx", f"{output_tag}.xlsx"))
 
-def main():
-    try:
-        args = parse_args()
 
-        if args.timesheet is None:
+def record_history(args, g: pd.DataFrame, timesheet: pathlib.Path):
+    if args.no_history:
+        return
+    with tracing.span("history", weeks=len(g)):
+        history.append(cd / args.history_dir, g, pay_calendar(args), str(timesheet.resolve()))
 
-            for i, f in enumerate(excel_files):
-                print(f"{i}: {f}")
 
-            print()
+def write_payroll(path: typing.Union[pathlib.Path, typing.BinaryIO], hours_output: pd.DataFrame, pay_output: pd.DataFrame, output_sheet_name: str = "Payroll"):
+    write_span = tracing.start("write", rows=len(hours_output) + len(pay_output))
+    workbook = xlsxwriter.Workbook(path)
+    
+    # Hours Output
+    toSheet(workbook=workbook, data=hours_output, sheet_name=output_sheet_name + ' - Hours')
 
-            args.timesheet = excel_files[int(input(f"Select a file (0-{len(excel_files)-1}) >>> "))]
+    # Pay Output
+    toSheet(workbook=workbook, data=pay_output, sheet_name=output_sheet_name + ' - Pay')
 
-        print()
+    workbook.close()
+    write_span.stop()
 
-        _main(args)
 
-        print()
+def _main(args):
 
-    except Exception as e:
-        print("ERROR : " + str(e))
-        print()
-        raise ValueError(str(e))
+    if args.verbose:
+        print(args)
 
-    finally:
-        input("Press Enter to exit ...")
 
+    pay_rates = read_pay_rates(cd / args.pay_rate_file, args.pay_rate_sheet_name, cache_dir(args))
+    if args.chunk_rows is not None:
+        g, d, hours_output, pay_output = calc_payroll_chunked(cd / args.timesheet, pay_rates, args)
+    else:
+        sheet = read_timesheet(cd / args.timesheet, args.timesheet_sheet_name, cache_dir(args))
+        state = incremental_state(args, cd / args.timesheet) if args.incremental else None
+        g, d, hours_output, pay_output = calc_payroll(sheet, pay_rates, args, state)
+        if args.cross_check:
+            cross_check(sheet, g, args)
 
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Save File
+    write_payroll(output_path(cd / args.timesheet, args.output_tag), hours_output, pay_output, args.output_sheet_name)
+    record_history(args, g, cd / args.timesheet)
+
+
+# ========================================================================
+# =================             Batch Mode             =====================
+# ========================================================================
+
+def batch_files(pattern: str, args) -> typing.List[pathlib.Path]:
+    """ Timesheets matched by a directory or glob, skipping lock files, outputs and the pay rate file """
+    path = cd / pattern
+    files = sorted(path.glob("*.xlsx")) if path.is_dir() else sorted(path.parent.glob(path.name))
+    pay_rate_file = (cd / args.pay_rate_file).resolve()
+    return [f for f in files if not f.name.startswith("~") and f.name.endswith(".xlsx") and not f.name.endswith(f"{args.output_tag}.xlsx") and f.resolve() != pay_rate_file]
+
+
+def _batch(args) -> int:
+    """ Process every timesheet in args.batch, reading the next files while the current one computes """
+    files = batch_files(args.batch, args)
+    pay_rates = read_pay_rates(cd / args.pay_rate_file, args.pay_rate_sheet_name, cache_dir(args))
+    employees = employee_registry(pay_rates, pay_rules(args))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=1) as reader:
+        read = lambda path: reader.submit(tracing.remote, read_timesheet, tracing.ENABLED, path, args.timesheet_sheet_name, cache_dir(args))
+        pending = collections.deque(read(path) for path in files[:2])
+
+        for i, path in enumerate(files):
+            future = pending.popleft()
+            if i + 2 < len(files):
+                pending.append(read(files[i + 2]))
+
+            st = datetime.now()
+            try:
+                sheet = tracing.merge(future.result())
+                waited = datetime.now() - st
+
+                state = incremental_state(args, path) if args.incremental else None
+                g, d, hours_output, pay_output = calc_payroll(sheet, pay_rates, args, state, employees)
+                if args.cross_check:
+                    cross_check(sheet, g, args)
+                write_payroll(output_path(path, args.output_tag), hours_output, pay_output, args.output_sheet_name)
+                record_history(args, g, path)
+                results.append({"File": path.name, "Status": "OK", "Read Wait": waited, "Duration": datetime.now() - st, "Error": ""})
+
+            except Exception as e:
+                results.append({"File": path.name, "Status": "FAILED", "Read Wait": None, "Duration": datetime.now() - st, "Error": str(e)})
+
+    summary = pd.DataFrame(results, columns=["File", "Status", "Read Wait", "Duration", "Error"])
+    failed = (summary["Status"] != "OK").sum()
+
+    print("\n\n=====  Batch  =====")
+    print(summary.to_string(index=False))
+    print(f"{len(files) - failed} of {len(files)} timesheets processed, {failed} failed")
+    return failed
@@ -0,0 +1,114 @@
+import json
+import typing
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+
+# ========================================================================
+# =================            Pay Rule Tables           =================
+# ========================================================================
+#
+# What used to be eight hand written `g["... Pay"]` formulas as data:
+#
+#   buckets     the four hours buckets the engines produce, each paid
+#               from one pay rate column times a multiplier
+#   sites       schedules with their own hour columns ("Paddington Day",
+#               ...), an optional $/hour differential added to the rate
+#               and an optional day window
+#   day_window  wall-clock [start, end) of day hours for everyone else
+#
+# The rules compile once into per-column lookup arrays, so every hours
+# column j is paid (rate[rate_column[j]] + differential[j]) * multiplier[j]
+# * hours[j]: one elementwise product over the whole hours array, with the
+# same float operations (and results) as the old formulas.  Sites and
+# differentials are added with a --pay-rules JSON file in the DEFAULT_RULES
+# layout, the calculation does not change.
+
+BUCKETS = ["Day", "Night", "Day_OT", "Night_OT"]
+
+DEFAULT_RULES = {
+    "buckets": {
+        "Day":      {"rate": "Day Rate",   "multiplier": 1},
+        "Night":    {"rate": "Night Rate", "multiplier": 1},
+        "Day_OT":   {"rate": "Day Rate",   "multiplier": 1.5},
+        "Night_OT": {"rate": "Night Rate", "multiplier": 1.5},
+    },
+    "day_window": ["06:00", "22:00"],
+    "sites": {
+        "Paddington": {"differential": 2},
+    },
+}
+
+
+def minute_of_day(clock: str) -> int:
+    hours, minutes = clock.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class PayRules:
+    __slots__ = ("rules", "sites", "columns", "regular_columns", "ot_columns", "rate_columns", "rate_of", "differential", "multiplier", "day_start", "day_end")
+
+    def __init__(self, rules: dict = DEFAULT_RULES):
+        missing = [bucket for bucket in BUCKETS if bucket not in rules["buckets"]]
+        if missing:
+            raise ValueError(f"Pay rules are missing buckets: {missing}")
+
+        self.rules = rules
+        self.sites = list(rules.get("sites", {}))
+        sites = [{}] + [rules["sites"][site] or {} for site in self.sites]   # site 0 is every other schedule
+
+        # One hours column per (site, bucket): Day, Night, Day_OT, Night_OT, <site> Day, ...
+        self.columns = [bucket if i == 0 else f"{self.sites[i - 1]} {bucket}" for i in range(len(sites)) for bucket in BUCKETS]
+        self.regular_columns = [column for column, bucket in zip(self.columns, BUCKETS * len(sites)) if not bucket.endswith("_OT")]
+        self.ot_columns      = [column for column, bucket in zip(self.columns, BUCKETS * len(sites)) if bucket.endswith("_OT")]
+        self.rate_columns = list(dict.fromkeys(rules["buckets"][bucket]["rate"] for bucket in BUCKETS))
+        self.rate_of        = np.array([self.rate_columns.index(rules["buckets"][bucket]["rate"]) for site in sites for bucket in BUCKETS])
+        self.differential   = np.array([site.get("differential", 0) for site in sites for bucket in BUCKETS])
+        self.multiplier     = np.array([rules["buckets"][bucket]["multiplier"] for site in sites for bucket in BUCKETS])
+
+        # Day window per site, in minutes of the day
+        windows = [site.get("day_window", rules.get("day_window", DEFAULT_RULES["day_window"])) for site in sites]
+        self.day_start = np.array([minute_of_day(start) for start, end in windows], dtype=np.int64)
+        self.day_end   = np.array([minute_of_day(end)   for start, end in windows], dtype=np.int64)
+        if (self.day_start > self.day_end).any():
+            raise ValueError("Day windows can not wrap past midnight")
+
+    @classmethod
+    def load(cls, path: typing.Optional[pathlib.Path] = None) -> "PayRules":
+        """ DEFAULT_RULES, or the rules in a JSON file """
+        return cls(DEFAULT_RULES if path is None else json.loads(pathlib.Path(path).read_text()))
+
+    def __repr__(self) -> str:
+        return f"PayRules({json.dumps(self.rules, sort_keys=True)})"
+
+    def column(self, site: int, bucket: str) -> str:
+        return self.columns[site * len(BUCKETS) + BUCKETS.index(bucket)]
+
+    def bucket_columns(self, bucket: str) -> typing.List[str]:
+        """ The `bucket` column of every site, the default site first """
+        return [self.column(site, bucket) for site in range(len(self.sites) + 1)]
+
+    def output_columns(self) -> typing.List[str]:
+        """ Hours columns in payroll workbook order: Day, Night, <site> Night, Night_OT, ..., Day_OT, ..., <site> Day """
+        return ["Day"] + self.bucket_columns("Night") + self.bucket_columns("Night_OT") + self.bucket_columns("Day_OT") + self.bucket_columns("Day")[1:]
+
+    def site(self, schedule) -> int:
+        """ Site number of a schedule, 0 for schedules without site rules """
+        return self.sites.index(schedule) + 1 if schedule in self.sites else 0
+
+    def site_codes(self, schedules: typing.Iterable) -> np.ndarray:
+        return np.array([self.site(schedule) for schedule in schedules], dtype=np.int64)
+
+    def rate_matrix(self, rates: np.ndarray) -> np.ndarray:
+        """ (rows, rate_columns) pay rates -> (rows, columns) $/hour of every hours column """
+        return (rates[:, self.rate_of] + self.differential) * self.multiplier
+
+    def pay(self, hours: pd.DataFrame, rates: pd.DataFrame) -> pd.DataFrame:
+        """ "<column> Pay" for every hours column, rates has the rate_columns on the same index """
+        pay = self.rate_matrix(rates[self.rate_columns].to_numpy(dtype=float)) * hours[self.columns].to_numpy(dtype=float)
+        return pd.DataFrame(pay, index=hours.index, columns=[f"{column} Pay" for column in self.columns])
+
+
+DEFAULT = PayRules()
@@ -0,0 +1,54 @@
+import typing
+
+import numpy as np
+
+
+# ========================================================================
+# =================          Pay Period Calendar          =================
+# ========================================================================
+#
+# Workweeks are counted from an anchor date with integer arithmetic on
+# wall-clock epoch minutes: week = (day - anchor) // 7, so the key keeps
+# counting through New Year's instead of jumping from "%U" week 52 back
+# to week 0, and a week that straddles Dec 31 is one week for overtime.
+# Pay periods are `weeks_per_period` consecutive workweeks from the
+# anchor.  The anchor is moved back to the workweek start day if it is
+# not on one.
+#
+# The defaults (Sunday weeks, two week periods starting Sunday Apr 2
+# 2023) give the same weeks as "%U" everywhere but across New Year's.
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DEFAULT_ANCHOR = "2023-04-02"
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class PayCalendar:
+    __slots__ = ("anchor", "weeks_per_period")
+
+    def __init__(self, week_start: str = "sunday", anchor: str = DEFAULT_ANCHOR, weeks_per_period: int = 2):
+        day = np.datetime64(anchor, 'D').astype(np.int64)
+        weekday = (day + 3) % 7   # Monday = 0, 1970-01-01 was a Thursday
+        self.anchor = int(day - (weekday - WEEKDAYS.index(week_start.lower())) % 7)   # epoch day the workweeks start from
+        self.weeks_per_period = weeks_per_period
+
+    def __repr__(self) -> str:
+        return f"PayCalendar(anchor={self.week_start_date(0)}, weeks_per_period={self.weeks_per_period})"
+
+    def week(self, wall: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """ Workweek of each wall-clock epoch minute, and the wall minute that week ends at """
+        week = (wall // MINUTES_PER_DAY - self.anchor) // 7
+        return week, (self.anchor + (week + 1) * 7) * MINUTES_PER_DAY
+
+    def period(self, week: np.ndarray) -> np.ndarray:
+        return week // self.weeks_per_period
+
+    def keys(self, wall: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """ (period, workweek) of each wall-clock epoch minute """
+        week, _ = self.week(wall)
+        return self.period(week), week
+
+    def week_start_date(self, week: np.ndarray) -> np.ndarray:
+        """ First day of each workweek as datetime64[D] """
+        return (self.anchor + np.asarray(week) * 7).astype('datetime64[D]')
@@ -0,0 +1,99 @@
+import typing
+
+import numpy as np
+import pandas as pd
+
+
+# ========================================================================
+# =================          Employee Registry           =================
+# ========================================================================
+#
+# Built once from the pay rate workbook: every employee's rates under a
+# normalised (LAST, FIRST) key, plus optional employee IDs (an "ID"
+# column) and aliases (an "ALIASES" column of "LAST, FIRST; LAST, FIRST").
+# Timesheet employees are matched with one hashed Index lookup, by ID
+# first and then by name, and the names that did not match, or matched
+# more than one employee, are known before any hours are calculated.
+#
+# Keys are upper case with runs of whitespace collapsed, so "Sealii " and
+# "SEALII" are the same employee.  Pay rate rows repeating a name keep the
+# highest rates (as the old groupby max did) and are reported as ambiguous
+# when their rates differ.
+
+ID_COLUMN = "ID"
+ALIAS_COLUMN = "ALIASES"
+AMBIGUOUS = -2
+
+
+def normalize(values: pd.Series) -> pd.Series:
+    return values.astype(str).str.upper().str.split().str.join(" ")
+
+
+def name_keys(last: pd.Series, first: pd.Series) -> pd.Series:
+    return normalize(last) + ", " + normalize(first)
+
+
+def id_keys(values: pd.Series) -> pd.Series:
+    """ Employee IDs as strings, 4519 and 4519.0 are the same ID, missing IDs stay missing """
+    return values.map(lambda value: None if pd.isna(value) else str(int(value)) if isinstance(value, (int, float, np.number)) and float(value).is_integer() else " ".join(str(value).upper().split()))
+
+
+def lookup(keys: pd.Series, targets: np.ndarray) -> pd.Series:
+    """ key -> target employee, keys pointing at more than one employee -> AMBIGUOUS """
+    pairs = pd.DataFrame({"key": keys.to_numpy(), "target": targets}).dropna(subset=["key"]).drop_duplicates()
+    counts = pairs["key"].map(pairs["key"].value_counts())
+    pairs.loc[counts.to_numpy() > 1, "target"] = AMBIGUOUS
+    pairs = pairs.drop_duplicates("key")
+    return pd.Series(pairs["target"].to_numpy(dtype=np.int64), index=pd.Index(pairs["key"].to_numpy()))
+
+
+class Registry:
+    __slots__ = ("rates", "names", "ids", "conflicting")
+
+    def __init__(self, pay_rates: pd.DataFrame, rate_columns: typing.List[str]):
+        pay_rates = pay_rates.dropna(subset=["LAST", "FIRST"])
+        key = name_keys(pay_rates["LAST"], pay_rates["FIRST"])
+
+        grouped = pay_rates.groupby(key.to_numpy(), sort=True)
+        self.rates = grouped[rate_columns].max()                                   # one row per employee
+        self.conflicting = set(self.rates.index[(grouped[rate_columns].nunique(dropna=False) > 1).any(axis=1).to_numpy()])
+        employee = self.rates.index.get_indexer(key)
+
+        names, targets = [key], [employee]
+        if ALIAS_COLUMN in pay_rates:
+            aliases = pay_rates[ALIAS_COLUMN].fillna("").astype(str).str.split(";").explode()
+            aliases = aliases[aliases.str.contains(",")].str.split(",", n=1)
+            names.append(name_keys(aliases.str[0], aliases.str[1]))
+            targets.append(employee[pay_rates.index.get_indexer(aliases.index)])
+        self.names = lookup(pd.concat(names, ignore_index=True), np.concatenate(targets))
+
+        self.ids = lookup(id_keys(pay_rates[ID_COLUMN]), employee) if ID_COLUMN in pay_rates else pd.Series(dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.rates)
+
+    def resolve(self, sheet: pd.DataFrame) -> typing.Tuple[pd.DataFrame, typing.Dict[str, typing.List[str]]]:
+        """ Rates indexed by the timesheet's (Last Name, First Name), and the unmatched / ambiguous employees
+
+        Unmatched names and names matching more than one employee get NaN rates.
+        """
+        employees = sheet.dropna(subset=["Last Name", "First Name"]).drop_duplicates(["Last Name", "First Name"]).sort_values(["Last Name", "First Name"])
+        names = name_keys(employees["Last Name"], employees["First Name"])
+
+        employee = np.full(len(employees), -1, dtype=np.int64)
+        if len(self.ids) and "Employee ID" in employees:
+            employee = self.ids.reindex(id_keys(employees["Employee ID"])).fillna(-1).to_numpy(dtype=np.int64)
+        by_name = self.names.reindex(names).fillna(-1).to_numpy(dtype=np.int64)
+        employee = np.where(employee == -1, by_name, employee)
+
+        matched = employee >= 0
+        index = pd.MultiIndex.from_frame(employees[["Last Name", "First Name"]])
+        rates = self.rates.reindex(self.rates.index[employee[matched]]).set_axis(index[matched], axis=0).reindex(index)
+
+        conflicting = np.zeros(len(employee), dtype=bool)
+        conflicting[matched] = np.isin(self.rates.index.to_numpy()[employee[matched]], list(self.conflicting))
+        report = {
+            "unmatched": names[employee == -1].tolist(),
+            "ambiguous": names[(employee == AMBIGUOUS) | conflicting].tolist(),
+        }
+        return rates, report
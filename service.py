@@ -0,0 +1,148 @@
+import io
+import json
+import typing
+import threading
+import urllib.parse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import payroll
+
+
+# ========================================================================
+# =================          Payroll Service             =================
+# ========================================================================
+#
+# A long running `python payroll.py --serve PORT`.  pandas, NumPy and the
+# timezone tables are imported once and the pay rate workbook is kept in
+# memory as the employee registry; it is re-read only when the file
+# changes on disk.
+#
+#   GET  /health                 {"status": "ok", "employees": <pay rate rows>}
+#   POST /payroll                body = timesheet .xlsx, returns the payroll .xlsx
+#   POST /payroll?format=json    same, returns {"hours": [...], "pay": [...]}
+#
+# Responses hold every employee's pay, so browsers only get CORS access
+# for the front-end origins of cors.json (or --allow-origin); a request
+# carrying any other Origin is refused before it is read.  Uploads over
+# --max-upload-mb are refused with 413.
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def allowed_origins(args) -> typing.Set[str]:
+    """ --allow-origin, or every origin of cors.json """
+    if args.allow_origin:
+        return set(args.allow_origin)
+    with open(payroll.cd / "cors.json") as f:
+        return {origin for rule in json.load(f) for origin in rule["origin"]}
+
+
+class PayRates:
+    """ The pay rate workbook and its employee registry, reloaded when the file's mtime changes """
+
+    def __init__(self, args):
+        self.args = args
+        self.path = payroll.cd / args.pay_rate_file
+        self.lock = threading.Lock()
+        self.mtime = None
+
+    def get(self):
+        with self.lock:
+            mtime = self.path.stat().st_mtime_ns
+            if mtime != self.mtime:
+                self.pay_rates = payroll.read_pay_rates(self.path, self.args.pay_rate_sheet_name, payroll.cache_dir(self.args))
+                self.employees = payroll.employee_registry(self.pay_rates, payroll.pay_rules(self.args))
+                self.mtime = mtime
+            return self.pay_rates, self.employees
+
+
+def make_handler(args, pay_rates: PayRates):
+    origins = allowed_origins(args)
+    max_upload = int(args.max_upload_mb * 1024 * 1024)
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def origin_allowed(self) -> bool:
+            """ Requests without an Origin (curl, scripts) are not from a browser page """
+            origin = self.headers.get("Origin")
+            return origin is None or origin in origins
+
+        def send(self, status: int, body: bytes, content_type: str = "application/json", headers: dict = {}):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if self.headers.get("Origin") in origins:
+                self.send_header("Access-Control-Allow-Origin", self.headers["Origin"])
+                self.send_header("Vary", "Origin")
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status: int, data: dict):
+            self.send(status, json.dumps(data).encode())
+
+        def do_OPTIONS(self):
+            if not self.origin_allowed():
+                return self.send_json(403, {"error": "Origin not allowed"})
+            self.send(204, b"", headers={"Access-Control-Allow-Methods": "GET, POST, OPTIONS", "Access-Control-Allow-Headers": "Content-Type"})
+
+        def do_GET(self):
+            if urllib.parse.urlparse(self.path).path != "/health":
+                return self.send_json(404, {"error": "Not Found"})
+            rates, _ = pay_rates.get()
+            self.send_json(200, {"status": "ok", "employees": len(rates)})
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path != "/payroll":
+                return self.send_json(404, {"error": "Not Found"})
+            if not self.origin_allowed():
+                self.close_connection = True
+                return self.send_json(403, {"error": "Origin not allowed"})
+            query = urllib.parse.parse_qs(url.query)
+
+            length = self.headers.get("Content-Length", "0")
+            if not length.isdigit():
+                self.close_connection = True
+                return self.send_json(400, {"error": "Invalid Content-Length"})
+            length = int(length)
+            if length > max_upload:
+                self.close_connection = True   # the body is never read
+                return self.send_json(413, {"error": f"Timesheet larger than {args.max_upload_mb:g} MB"})
+
+            st = datetime.now()
+            try:
+                body = self.rfile.read(length)
+                sheet = payroll.read_timesheet(io.BytesIO(body), query.get("sheet", [args.timesheet_sheet_name])[0])
+                rates, employees = pay_rates.get()
+                g, d, hours_output, pay_output = payroll.calc_payroll(sheet, rates, args, employees=employees)
+            except Exception as e:
+                return self.send_json(400, {"error": str(e)})
+
+            duration = {"X-Duration-Ms": str(int((datetime.now() - st).total_seconds() * 1000))}
+            if query.get("format", ["xlsx"])[0] == "json":
+                hours = hours_output.reset_index().to_json(orient="records")
+                pay = pay_output.reset_index().to_json(orient="records")
+                return self.send(200, f'{{"hours": {hours}, "pay": {pay}}}'.encode(), headers=duration)
+
+            output = io.BytesIO()
+            payroll.write_payroll(output, hours_output, pay_output, args.output_sheet_name)
+            self.send(200, output.getvalue(), XLSX, headers={**duration, "Content-Disposition": f'attachment; filename="{args.output_sheet_name}.xlsx"'})
+
+    return Handler
+
+
+def serve(args):
+    pay_rates = PayRates(args)
+    pay_rates.get()
+
+    server = ThreadingHTTPServer((args.host, args.serve), make_handler(args, pay_rates))
+    print(f"Serving payroll on http://{args.host}:{server.server_port}/payroll")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
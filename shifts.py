@@ -0,0 +1,61 @@
+import typing
+
+import numpy as np
+import pandas as pd
+
+import timezone
+
+
+# ========================================================================
+# =================          Compact Shift Table          =================
+# ========================================================================
+#
+# One fixed size record per timesheet row instead of a DataFrame row of
+# Python objects: the employee and the schedule are integer codes into
+# `names` / `schedules`, start and end are the localised [start, end)
+# whole minutes as int64 UTC epoch minutes.  22 bytes a shift, so a two
+# week file of a few hundred employees is a few hundred kilobytes.
+
+SHIFT = np.dtype([("employee", np.int32), ("schedule", np.int16), ("start", np.int64), ("end", np.int64)])
+
+
+def check_times(sheet: pd.DataFrame):
+    """ ValueError naming the first row without a Start Time or End Time, rows are numbered like the worksheet (header = row 1) """
+    for column in ["Start Time", "End Time"]:
+        missing = sheet[column].isna().to_numpy()
+        if missing.any():
+            row = sheet[missing].iloc[0]
+            raise ValueError(f"Missing {column} for {row['Last Name']}, {row['First Name']} on sheet row {sheet.index[missing][0] + 2}")
+
+
+class ShiftTable:
+    __slots__ = ("records", "names", "schedules")
+
+    def __init__(self, records: np.ndarray, names: pd.MultiIndex, schedules: pd.Index):
+        self.records = records       # SHIFT records in sheet row order
+        self.names = names           # (Last Name, First Name) per employee code, sorted
+        self.schedules = schedules   # Schedule per schedule code, -1 is a missing schedule
+
+    @classmethod
+    def from_sheet(cls, sheet: pd.DataFrame, dst_policy: str = "raise") -> "ShiftTable":
+        """ Rows without a name are dropped, employee codes follow the sorted (Last Name, First Name) order
+
+        `dst_policy` is the timezone policy for wall-clock times a DST switch makes ambiguous or nonexistent.
+        """
+        sheet = sheet.dropna(subset=["Last Name", "First Name"])
+        check_times(sheet)
+        grouped = sheet.groupby(["Last Name", "First Name"], sort=True)
+        schedule, schedules = pd.factorize(sheet["Schedule"])
+
+        records = np.empty(len(sheet), dtype=SHIFT)
+        records["employee"] = grouped.ngroup().to_numpy()
+        records["schedule"] = schedule
+        records["start"], records["end"] = timezone.to_utc_minutes(sheet["Start Time"], sheet["End Time"], dst_policy)
+        return cls(records, grouped.size().index, schedules)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def employee_names(self, employee: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """ (Last Name, First Name) arrays for an array of employee codes """
+        return self.names.get_level_values(0).to_numpy()[employee], self.names.get_level_values(1).to_numpy()[employee]
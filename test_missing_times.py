@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+import payroll
+import shifts
+import benchmark
+
+
+# ========================================================================
+# =================         Missing Time Regression      =================
+# ========================================================================
+#
+# An employee still clocked in at export has no End Time, a row typed in
+# by hand may have no Start Time.  Both engines must refuse the row, the
+# interval engine naming the employee and the worksheet row, instead of
+# turning it into a shift that runs to the end of time or silently
+# dropping it.
+#
+#   python -m pytest test_missing_times.py
+
+def sheet_missing(column: str) -> pd.DataFrame:
+    """ A small synthetic timesheet with `column` blank in its last row """
+    entries, _ = benchmark.synthetic_timesheet(benchmark.SHIFTS_PER_EMPLOYEE * 2)
+    sheet = payroll.prepare_timesheet(entries)
+    sheet.loc[sheet.index[-1], column] = pd.NaT
+    return sheet
+
+
+@pytest.mark.parametrize("column", ["Start Time", "End Time"])
+def test_interval_engine_names_the_row(column):
+    sheet = sheet_missing(column)
+    row = sheet.index[-1]
+    expected = f"Missing {column} for {sheet.loc[row, 'Last Name']}, {sheet.loc[row, 'First Name']} on sheet row {row + 2}"
+    with pytest.raises(ValueError) as error:
+        shifts.ShiftTable.from_sheet(sheet)
+    assert str(error.value) == expected
+
+
+@pytest.mark.parametrize("column", ["Start Time", "End Time"])
+def test_minute_engine_rejects_the_row(column):
+    with pytest.raises(ValueError):
+        payroll.calc_hours(sheet_missing(column), "minute")
@@ -0,0 +1,109 @@
+import functools
+import typing
+
+import numpy as np
+import pandas as pd
+import pytz
+
+
+# ========================================================================
+# =================        Timezone Transition Table       ===============
+# ========================================================================
+#
+# The UTC offset of a zone only changes at its transitions, so localising
+# a whole column of wall-clock times is two `searchsorted` lookups into
+# the zone's transition table instead of a pytz call per value.  Tables
+# are built once per zone (pytz carries the rules through 2037) and kept.
+#
+# Wall-clock times a DST switch makes ambiguous or nonexistent follow a
+# fixed policy:
+#
+#   "raise"     AmbiguousTimeError / NonExistentTimeError, exactly what
+#               `tz_localize` and `pd.date_range(..., tz=...)` (the minute
+#               reference engine) do.  The default.
+#   "earliest"  an ambiguous time (fall back, 01:00-02:00 happens twice)
+#               is its first occurrence, still on daylight time.
+#   "latest"    an ambiguous time is its second occurrence, on standard time.
+#
+# With "earliest" and "latest" a nonexistent time (spring forward, 02:00-
+# 03:00 is skipped) moves forward to the end of the gap, 03:00.
+
+DEFAULT = 'America/Denver'
+POLICIES = ["raise", "earliest", "latest"]
+
+MINUTES_PER_DAY = 24 * 60
+NS_PER_MINUTE = 60 * 1_000_000_000
+NAT = np.iinfo(np.int64).min
+
+
+class Zone:
+    __slots__ = ("name", "transitions", "offsets")
+
+    def __init__(self, name: str):
+        tz = pytz.timezone(name)
+        self.name = name
+        if hasattr(tz, "_utc_transition_times"):
+            # UTC transition instants (epoch minutes) and the offset (minutes) in effect from each one on
+            self.transitions = np.array(tz._utc_transition_times, dtype='datetime64[m]').astype(np.int64)
+            self.offsets = np.array([int(info[0].total_seconds()) // 60 for info in tz._transition_info], dtype=np.int64)
+        else:
+            self.transitions = np.array([np.iinfo(np.int64).min], dtype=np.int64)
+            self.offsets = np.array([int(tz.utcoffset(None).total_seconds()) // 60], dtype=np.int64)
+
+    def index(self, utc: np.ndarray) -> np.ndarray:
+        """ Transition in effect at each UTC epoch minute """
+        return np.searchsorted(self.transitions, utc, side='right') - 1
+
+    def offset(self, utc: np.ndarray) -> np.ndarray:
+        """ UTC offset (minutes) at each UTC epoch minute """
+        return self.offsets[self.index(utc)]
+
+    def localize(self, wall: np.ndarray, policy: str = "raise") -> np.ndarray:
+        """ Naive wall-clock epoch nanoseconds -> UTC epoch nanoseconds, ValueError on NaT """
+        wall = np.asarray(wall, dtype=np.int64)
+        if (wall == NAT).any():
+            raise ValueError(f"Cannot localize NaT to {self.name}, every time needs a value")
+
+        # Every wall time has one of the offsets around it, each is valid if it maps back to itself
+        minute = wall // NS_PER_MINUTE
+        before, after = self.offset(minute - MINUTES_PER_DAY), self.offset(minute + MINUTES_PER_DAY)
+        utc_before, utc_after = wall - before * NS_PER_MINUTE, wall - after * NS_PER_MINUTE
+        valid_before = self.offset(utc_before // NS_PER_MINUTE) == before
+        valid_after = self.offset(utc_after // NS_PER_MINUTE) == after
+
+        ambiguous = valid_before & valid_after & (before != after)
+        nonexistent = ~valid_before & ~valid_after
+        if policy == "raise":
+            if ambiguous.any():
+                raise pytz.AmbiguousTimeError(f"Cannot infer dst time from {pd.Timestamp(wall[ambiguous][0])}, try using the 'ambiguous' argument")
+            if nonexistent.any():
+                raise pytz.NonExistentTimeError(str(pd.Timestamp(wall[nonexistent][0])))
+        elif policy not in POLICIES:
+            raise ValueError(f"Unknown DST policy {policy!r}, expected one of {POLICIES}")
+
+        if policy == "latest":
+            utc = np.where(valid_after, utc_after, utc_before)
+        else:
+            utc = np.where(valid_before, utc_before, utc_after)
+
+        # Skipped wall times land on the transition that skipped them
+        gap_end = self.transitions[self.index(utc_before // NS_PER_MINUTE)] * NS_PER_MINUTE
+        utc = np.where(nonexistent, gap_end, utc)
+        return utc
+
+
+@functools.lru_cache(maxsize=None)
+def zone(name: str = DEFAULT) -> Zone:
+    return Zone(name)
+
+
+def to_utc_minutes(start_times: pd.Series, end_times: pd.Series, policy: str = "raise", name: str = DEFAULT) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """ Localise shifts and return their [start, end) ranges of whole minutes in UTC epoch minutes
+
+    The minutes `pd.date_range(start.floor("min"), end, freq="min", tz=name)[:-1]` covers.
+    """
+    tz = zone(name)
+    start = tz.localize(pd.DatetimeIndex(start_times).floor('min').asi8, policy)
+    end   = tz.localize(pd.DatetimeIndex(end_times).asi8, policy)
+    start = start // NS_PER_MINUTE
+    return start, start + np.maximum((end - start * NS_PER_MINUTE) // NS_PER_MINUTE, 0)
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import typing
+import threading
+
+
+# ========================================================================
+# =================        Tracing / Profiling           =================
+# ========================================================================
+#
+# Off by default.  While off `span()` hands back one shared no-op object
+# and `debug()` returns before anything is formatted, so the calculation
+# pays a function call and nothing else.  `--profile FILE` turns spans on
+# and writes either a JSON summary or a Chrome trace (chrome://tracing,
+# Perfetto, speedscope) when the run finishes; `-v` turns `debug()` on.
+# Worker process spans are included, each under its own pid.
+
+ENABLED = False
+VERBOSE = False
+
+events: typing.List[dict] = []
+
+
+class Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: dict):
+        self.name, self.args = name, args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        events.append({"name": self.name, "ts": self.start / 1000, "dur": (end - self.start) / 1000, "pid": os.getpid(), "tid": threading.get_ident(), "args": self.args})
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def stop(self):
+        self.__exit__()
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+    def stop(self):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name: str, **args) -> typing.Union[Span, NullSpan]:
+    """ `with span("stage", rows=n) as s: ...; s.set(more=m)` """
+    return Span(name, args) if ENABLED else NULL_SPAN
+
+
+def start(name: str, **args) -> typing.Union[Span, NullSpan]:
+    """ span() for long flat code: `s = start("stage")` ... `s.stop()` """
+    return span(name, **args).__enter__()
+
+
+def timed(name: str, func: typing.Callable, label: typing.Callable = lambda *a: None) -> typing.Callable:
+    """ Wrap func so every call is a span named `name`; returns func itself when tracing is off """
+    if not ENABLED:
+        return func
+
+    def wrapper(*a, **kw):
+        with span(name, item=label(*a)):
+            return func(*a, **kw)
+    return wrapper
+
+
+def debug(*values, prefix: typing.Optional[str] = None):
+    """ print() that only runs (and only formats its arguments) with --verbose """
+    if not VERBOSE:
+        return
+    if prefix:
+        print(prefix)
+    print(*values)
+
+
+def configure(profile: bool = False, verbose: bool = False):
+    global ENABLED, VERBOSE
+    ENABLED, VERBOSE = profile, verbose
+    events.clear()
+
+
+# Spans recorded in a worker process stay in that process's `events`.  Pool
+# work goes through `remote` instead, which records them with the parent's
+# setting and ships them back with the result for `merge` to add here.
+
+def remote(func: typing.Callable, enabled: bool, *a):
+    """ func(*a) in a worker process, returns (result, the spans it recorded) """
+    global ENABLED
+    ENABLED = enabled
+    events.clear()   # a forked worker starts with a copy of the parent's spans
+    return func(*a), list(events)
+
+
+def merge(returned: typing.Tuple[typing.Any, typing.List[dict]]):
+    """ Result of a `remote` call, its spans added to this process's """
+    result, spans = returned
+    events.extend(spans)
+    return result
+
+
+# ========================================================================
+# =================               Export                 =================
+# ========================================================================
+
+def summary() -> typing.List[dict]:
+    """ Count, total and max duration (seconds) per span name, slowest first """
+    stages = {}
+    for event in events:
+        stage = stages.setdefault(event["name"], {"name": event["name"], "count": 0, "total": 0.0, "max": 0.0})
+        stage["count"] += 1
+        stage["total"] += event["dur"] / 1e6
+        stage["max"] = max(stage["max"], event["dur"] / 1e6)
+    return sorted(stages.values(), key=lambda stage: -stage["total"])
+
+
+def print_summary():
+    print("\n\n=====  Profile  =====")
+    print(f"{'Stage':<20} {'Count':>8} {'Total (s)':>12} {'Max (s)':>12}")
+    for stage in summary():
+        print(f"{stage['name']:<20} {stage['count']:>8} {stage['total']:>12.4f} {stage['max']:>12.4f}")
+
+
+def export(path: str, format: str = "json"):
+    """ format "json": {"summary": [...], "events": [...]}, format "trace": Chrome trace event format """
+    if format == "trace":
+        data = {"traceEvents": [{**event, "ph": "X", "cat": "payroll"} for event in events], "displayTimeUnit": "ms"}
+    else:
+        data = {"summary": summary(), "events": events}
+
+    with open(path, "w") as f:
+        json.dump(data, f, default=str)
@@ -0,0 +1,125 @@
+import asyncio
+import pathlib
+import typing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import payroll
+import service
+import tracing
+
+
+# ========================================================================
+# =================          Watch Folder Daemon         =================
+# ========================================================================
+#
+# `python payroll.py --watch DIR` polls DIR for timesheets and computes
+# each one as it arrives, writing "<timesheet> - Payroll.xlsx" next to it.
+#
+# A file is picked up once its size and mtime have not changed for
+# --settle seconds and Excel has no "~$<name>" lock file open for it, so
+# half copied uploads and workbooks still being saved are left alone.
+# Ready files go on an asyncio queue drained by a fixed pool of worker
+# processes (--watch-workers): a burst of uploads at period close is
+# worked through in parallel with no process started per file, and each
+# worker keeps the pay rate registry warm between files.  Timesheets whose
+# output is already newer than the input are skipped on startup.
+
+pay_rates = None   # per worker process: service.PayRates, reloaded when the pay rate file changes
+
+
+def process(path: pathlib.Path, args) -> float:
+    """ One timesheet in a worker process, returns the seconds it took """
+    global pay_rates
+    if pay_rates is None:
+        pay_rates = service.PayRates(args)
+
+    st = datetime.now()
+    sheet = payroll.read_timesheet(path, args.timesheet_sheet_name, payroll.cache_dir(args))
+    rates, employees = pay_rates.get()
+    state = payroll.incremental_state(args, path) if args.incremental else None
+    g, d, hours_output, pay_output = payroll.calc_payroll(sheet, rates, args, state, employees)
+    if args.cross_check:
+        payroll.cross_check(sheet, g, args)
+    payroll.write_payroll(payroll.output_path(path, args.output_tag), hours_output, pay_output, args.output_sheet_name)
+    payroll.record_history(args, g, path)
+    return (datetime.now() - st).total_seconds()
+
+
+def lock_file(path: pathlib.Path) -> pathlib.Path:
+    return path.with_name("~$" + path.name)
+
+
+class Watcher:
+    """ Settled, unlocked, not yet processed timesheets of a directory """
+
+    def __init__(self, args):
+        self.args = args
+        self.seen: typing.Dict[pathlib.Path, typing.Tuple[int, int, float]] = {}   # path -> (mtime, size, first seen with them)
+        self.done: typing.Dict[pathlib.Path, typing.Tuple[int, int]] = {}
+
+        # Outputs newer than their timesheet were computed before we started
+        for path in payroll.batch_files(args.watch, args):
+            output = payroll.output_path(path, args.output_tag)
+            if output.exists() and output.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+                stat = path.stat()
+                self.done[path] = (stat.st_mtime_ns, stat.st_size)
+
+    def ready(self, now: float) -> typing.List[pathlib.Path]:
+        found = []
+        for path in payroll.batch_files(self.args.watch, self.args):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            version = (stat.st_mtime_ns, stat.st_size)
+            if self.done.get(path) == version:
+                continue
+
+            if self.seen.get(path, (None, None, None))[:2] != version:
+                self.seen[path] = (*version, now)   # new or still being written, wait for it to settle
+                continue
+            if now - self.seen[path][2] < self.args.settle or lock_file(path).exists():
+                continue
+
+            self.done[path] = version
+            found.append(path)
+        return found
+
+
+async def worker(queue: asyncio.Queue, pool: ProcessPoolExecutor, args):
+    loop = asyncio.get_running_loop()
+    while True:
+        path = await queue.get()
+        try:
+            seconds = tracing.merge(await loop.run_in_executor(pool, tracing.remote, process, tracing.ENABLED, path, args))
+            print(f"{datetime.now():%H:%M:%S}  OK      {path.name}  {seconds:.2f}s  ({queue.qsize()} waiting)", flush=True)
+        except Exception as e:
+            print(f"{datetime.now():%H:%M:%S}  FAILED  {path.name}  {e}", flush=True)
+        finally:
+            queue.task_done()
+
+
+async def run(args):
+    watcher = Watcher(args)
+    queue: asyncio.Queue = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(max_workers=args.watch_workers) as pool:
+        workers = [asyncio.create_task(worker(queue, pool, args)) for _ in range(args.watch_workers)]
+        print(f"Watching {payroll.cd / args.watch} with {args.watch_workers} workers, Ctrl+C to stop", flush=True)
+        try:
+            while True:
+                for path in watcher.ready(loop.time()):
+                    queue.put_nowait(path)
+                await asyncio.sleep(args.poll)
+        finally:
+            for task in workers:
+                task.cancel()
+
+
+def watch(args):
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass